@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+"""
+Throughput benchmark of the code tokenizers on the sample diffs in
+benchmarks/samples, one per language.
+
+Each tokenizer mode runs in its own process so the reported peak memory
+(max resident set size of the process and its pool workers) only accounts
+for that mode. Usage:
+
+    python benchmarks/tokenizers.py
+    python benchmarks/tokenizers.py -l python java -m lines native -r 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from multiprocessing import cpu_count
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = os.path.join(ROOT, "benchmarks", "samples")
+sys.path.insert(0, ROOT)
+
+from commitgen.diff import AddRemExtractor, parse_diff
+from commitgen.code import CodeChunkTokenizer, CodeLinesTokenizer
+from pygments.token import Comment, String, Whitespace, Text
+
+LANGUAGES = ["python", "javascript", "java", "cpp"]
+
+# name: (tokenizer class, engine)
+TOKENIZERS = [("chunks", (CodeChunkTokenizer, "pygments")),
+              ("lines", (CodeLinesTokenizer, "pygments")),
+              ("native", (CodeLinesTokenizer, "native"))]
+
+MODES = [name for name, _ in TOKENIZERS] + [name + "+pool" for name, _ in TOKENIZERS]
+
+# same as preprocess.py
+IGNORE_TYPES = [Comment, String, Whitespace, Text]
+MARKER = "NEW_FILE"
+
+
+def load_chunks(language):
+    """
+    Extracts the code line chunks of the sample diff of a language the way
+    preprocess.py does, with the add_rem extractor and one chunk per file
+
+    :param language: python, javascript, java or cpp
+    :return: list of lists of code lines
+    """
+    with open(os.path.join(SAMPLES, language + ".diff")) as f:
+        diff = f.read().decode('utf-8')
+    code_lines = AddRemExtractor(marker=MARKER).get_lines(parse_diff(diff.splitlines()))
+    chunks = []
+    for code_line in code_lines:
+        if code_line == MARKER:
+            chunks.append([])
+        else:
+            chunks[-1].append(code_line)
+    return [chunk for chunk in chunks if chunk]
+
+
+def make_tokenizer(language, mode):
+    tokenizer_class, engine = dict(TOKENIZERS)[mode.split("+")[0]]
+    return tokenizer_class(language=language, engine=engine)
+
+
+def peak_memory():
+    """
+    :return: max resident set size in MB of this process and its waited-for children
+    """
+    maxrss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on OS X
+    if sys.platform == "darwin":
+        return maxrss / (1024.0 * 1024.0)
+    return maxrss / 1024.0
+
+
+def run_mode(language, mode, copies, repeat, workers):
+    """
+    Tokenizes copies of the language sample chunks repeat times with a
+    tokenizer mode and keeps the fastest round
+
+    :return: dict with the lines, tokens, best time and peak memory
+    """
+    chunks = load_chunks(language) * copies
+    tokenizer = make_tokenizer(language, mode)
+    pool = mode.endswith("+pool")
+    best = None
+    tokens = 0
+    for _ in range(repeat):
+        start = time.time()
+        if pool:
+            results = tokenizer.batch_tokenize(chunks, ignore_types=IGNORE_TYPES,
+                                               num_processes=workers)
+        else:
+            results = [tokenizer.tokenize(chunk, ignore_types=IGNORE_TYPES)
+                       for chunk in chunks]
+        elapsed = time.time() - start
+        tokens = sum([len(result) for result in results])
+        if best is None or elapsed < best:
+            best = elapsed
+    # joins the pool workers so they count in RUSAGE_CHILDREN
+    tokenizer.close()
+    return {"language": language,
+            "mode": mode,
+            "lines": sum([len(chunk) for chunk in chunks]),
+            "tokens": tokens,
+            "seconds": best,
+            "memory": peak_memory()}
+
+
+def spawn_mode(language, mode, args):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                      "--run", language, mode,
+                                      "--copies", str(args.copies),
+                                      "--repeat", str(args.repeat),
+                                      "--workers", str(args.workers)])
+    return json.loads(output.splitlines()[-1])
+
+
+desc = "Benchmark the throughput of the code tokenizers on the sample diffs"
+
+parser = argparse.ArgumentParser(description=desc)
+
+parser.add_argument('--languages', "-l",
+                    nargs="+",
+                    choices=LANGUAGES,
+                    default=LANGUAGES,
+                    help="Languages to benchmark. Default: all of " + ', '.join(LANGUAGES),
+                    metavar="")
+
+parser.add_argument('--modes', "-m",
+                    nargs="+",
+                    choices=MODES,
+                    default=MODES,
+                    help="Tokenizer modes to benchmark, '+pool' modes use batch_tokenize. "
+                         "Default: all of " + ', '.join(MODES),
+                    metavar="")
+
+parser.add_argument('--copies', "-c",
+                    type=int,
+                    default=20,
+                    help="Number of times the sample chunks are tokenized per round. Default=20")
+
+parser.add_argument('--repeat', "-r",
+                    type=int,
+                    default=3,
+                    help="Number of timed rounds, the fastest is reported. Default=3")
+
+parser.add_argument('--workers', "-w",
+                    type=int,
+                    default=cpu_count(),
+                    help="Number of processes of the '+pool' modes. Default=number of cpus")
+
+parser.add_argument('--run',
+                    nargs=2,
+                    default=None,
+                    help=argparse.SUPPRESS)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.run:
+        language, mode = args.run
+        print json.dumps(run_mode(language, mode, args.copies, args.repeat, args.workers))
+        sys.exit(0)
+
+    row = "{:<12}{:<20}{:>10}{:>12}{:>14}{:>12}"
+    print row.format("language", "mode", "lines", "lines/s", "tokens/s", "memory MB")
+    for language in args.languages:
+        for mode in args.modes:
+            result = spawn_mode(language, mode, args)
+            print row.format(language, mode, result["lines"],
+                             "%.0f" % (result["lines"] / result["seconds"]),
+                             "%.0f" % (result["tokens"] / result["seconds"]),
+                             "%.1f" % result["memory"])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+"""
+Microbenchmark of the token type filtering of the tokenizers: in_any()
+against the memoized TypeFilter of get_type_filter(), on the token types
+the lexers produce for the sample diffs in benchmarks/samples, in the
+order they are produced. Usage:
+
+    python benchmarks/type_filter.py
+    python benchmarks/type_filter.py -l python cpp -e native -r 5
+"""
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from commitgen.code import CodeLinesTokenizer, in_any, get_type_filter
+from pygments.token import Comment, String, Whitespace, Text
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from tokenizers import LANGUAGES, load_chunks
+
+# same as preprocess.py
+IGNORE_TYPES = [Comment, String, Whitespace, Text]
+ENGINES = ["pygments", "native"]
+
+
+def sample_types(language, engine):
+    """
+    :return: list with the type of each token of the language sample chunks,
+             before any filtering
+    """
+    tokenizer = CodeLinesTokenizer(language=language, engine=engine)
+    types = []
+    for chunk in load_chunks(language):
+        types += tokenizer.tokenize(chunk, return_types=True)[1]
+    return types
+
+
+def time_filter(keep, types, repeat):
+    """
+    :param keep: function from a token type to whether it is kept
+    :return: fastest time of repeat rounds filtering all the types
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for ttype in types:
+            keep(ttype)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+desc = "Benchmark in_any against the memoized TypeFilter on the sample token types"
+
+parser = argparse.ArgumentParser(description=desc)
+
+parser.add_argument('--languages', "-l",
+                    nargs="+",
+                    choices=LANGUAGES,
+                    default=LANGUAGES,
+                    help="Languages to benchmark. Default: all of " + ', '.join(LANGUAGES),
+                    metavar="")
+
+parser.add_argument('--engines', "-e",
+                    nargs="+",
+                    choices=ENGINES,
+                    default=ENGINES,
+                    help="Lexer engines producing the token types. Default: all of " + ', '.join(ENGINES),
+                    metavar="")
+
+parser.add_argument('--copies', "-c",
+                    type=int,
+                    default=20,
+                    help="Number of times the sample token types are filtered per round. Default=20")
+
+parser.add_argument('--repeat', "-r",
+                    type=int,
+                    default=3,
+                    help="Number of timed rounds, the fastest is reported. Default=3")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    row = "{:<12}{:<10}{:>10}{:>16}{:>16}{:>10}"
+    print row.format("language", "engine", "tokens", "in_any ns/tok", "filter ns/tok", "speedup")
+    for language in args.languages:
+        for engine in args.engines:
+            types = sample_types(language, engine) * args.copies
+            type_filter = get_type_filter(IGNORE_TYPES)
+            if [not in_any(ttype, IGNORE_TYPES) for ttype in types] != [type_filter[ttype] for ttype in types]:
+                raise AssertionError("TypeFilter differs from in_any for " + language + " " + engine)
+            in_any_time = time_filter(lambda ttype: not in_any(ttype, IGNORE_TYPES), types, args.repeat)
+            filter_time = time_filter(lambda ttype: type_filter[ttype], types, args.repeat)
+            print row.format(language, engine, len(types),
+                             "%.0f" % (1e9 * in_any_time / len(types)),
+                             "%.0f" % (1e9 * filter_time / len(types)),
+                             "%.1fx" % (in_any_time / filter_time))
@@ -3,10 +3,10 @@
 
 from os import path
 import json
-import pickle
 import os
 import argparse
-from commitgen.data import build_data, split_list, build_vocab
+from commitgen.data import DataBuilder, split_list, build_vocab_from_counts, load_stream, stream_length, \
+    count_vocab_files, merge_vocab_counts, save_vocab_counts, load_vocab_counts
 
 desc = "Help for buildData"
 work_dir = os.environ['WORK_DIR']
@@ -48,6 +48,17 @@ parser.add_argument("--ratio", "-r",
                     default=0.8,
                     help="Train/Test split ratio")
 
+parser.add_argument("--workers", "-w",
+                    type=int,
+                    default=1,
+                    help="Number of processes counting the vocabulary, each dataset is split "
+                         "into that many shards")
+
+parser.add_argument("--counts_only",
+                    action='store_true',
+                    help="Only count the vocabulary of each dataset into <dataset>.counts.json, "
+                         "which later runs reuse while it is newer than the pickle")
+
 args = parser.parse_args()
 
 work_dir = os.path.join(work_dir, "preprocessing")
@@ -59,20 +70,37 @@ if "," in args.dataset:
 else:
     datasets = [args.dataset]
 
-per_dataset_parsed_commits = []
-all_parsed_commits = []
-
+filepaths = []
 for dataset in datasets:
-  filepath = os.path.join(work_dir, dataset + ".pickle")
-  if os.path.isfile(filepath):
-      with open(filepath, "rb") as f:
-          parsed_commits = pickle.load(f)
-      per_dataset_parsed_commits.append(parsed_commits)
-      all_parsed_commits += parsed_commits
-  else:
-    raise IOError("Pickle file does not exist")
-
-vocab = build_vocab(all_parsed_commits, args.code_unk_threshold, args.nl_unk_threshold)
+    filepath = os.path.join(work_dir, dataset + ".pickle")
+    if not os.path.isfile(filepath):
+        raise IOError("Pickle file does not exist")
+    filepaths.append(filepath)
+
+# counting the vocabulary of each dataset, reusing the counts of previous runs
+counts_paths = [os.path.join(work_dir, dataset + ".counts.json") for dataset in datasets]
+to_count = [i for i, counts_path in enumerate(counts_paths)
+            if args.counts_only
+            or not os.path.isfile(counts_path)
+            or os.path.getmtime(counts_path) < os.path.getmtime(filepaths[i])]
+
+dataset_counts = [None] * len(datasets)
+for i, counts in zip(to_count, count_vocab_files([filepaths[i] for i in to_count], args.workers)):
+    dataset_counts[i] = counts
+    with open(counts_paths[i], 'w') as f:
+        save_vocab_counts(counts, f)
+
+if args.counts_only:
+    exit()
+
+for i, counts_path in enumerate(counts_paths):
+    if dataset_counts[i] is None:
+        with open(counts_path) as f:
+            dataset_counts[i] = load_vocab_counts(f)
+
+vocab = build_vocab_from_counts(merge_vocab_counts(dataset_counts),
+                                args.code_unk_threshold, args.nl_unk_threshold)
+dataset_counts = None
 
 dataset_name = "_".join(datasets)
 
@@ -81,39 +109,55 @@ vocab_file_name = ".".join([dataset_name, args.language, 'vocab.json'])
 with open(path.join(work_dir, vocab_file_name), 'w') as f:
     json.dump(vocab, f)
 
-all_train = []
-all_valid = []
-all_test = []
-
-for parsed_commits in per_dataset_parsed_commits:
-    # splitting dataset
-    train, valid, test = split_list(parsed_commits, generate_test=args.test, ratio=args.ratio)
-    all_train += train
-    all_valid += valid
-    all_test += test
-
-print len(all_train), len(all_valid), len(all_test)
-# generating data and saving files
-train_data = build_data(all_train, vocab,
-                        max_code_length=args.code_max_length,
-                        max_nl_length=args.nl_max_length)
+# splitting the positions of the commits of each dataset, the number of
+# commits is read from the offsets at the end of the pickles
+splits = []
+for filepath in filepaths:
+    with open(filepath, "rb") as f:
+        num_commits = stream_length(f)
+    train, valid, test = split_list(range(num_commits), generate_test=args.test, ratio=args.ratio)
+    splits.append((set(train), set(valid), set(test)))
+
+print sum(len(train) for train, _, _ in splits), sum(len(valid) for _, valid, _ in splits), \
+    sum(len(test) for _, _, test in splits)
+
+# generating data in a single pass over each pickle
+train_builder = DataBuilder(vocab,
+                            max_code_length=args.code_max_length,
+                            max_nl_length=args.nl_max_length)
+valid_builder = DataBuilder(vocab,
+                            max_code_length=args.code_max_length,
+                            max_nl_length=args.nl_max_length)
+# we don't set a maximum length ONLY for test data
+test_builder = DataBuilder(vocab, ref=True)
+
+for filepath, (train, valid, test) in zip(filepaths, splits):
+    with open(filepath, "rb") as f:
+        for i, parsed_commit in enumerate(load_stream(f)):
+            if i in train:
+                train_builder.add(parsed_commit)
+            if i in valid:
+                valid_builder.add(parsed_commit)
+            if i in test:
+                test_builder.add(parsed_commit)
+splits = None
+
+# saving files
+train_data = train_builder.build()
 
 train_name = ".".join([dataset_name, args.language, "train.json"])
 with open(os.path.join(work_dir, train_name), 'w') as f:
     json.dump(train_data, f)
 
 
-valid_data = build_data(all_valid, vocab,
-                        max_code_length=args.code_max_length,
-                        max_nl_length=args.nl_max_length)
+valid_data = valid_builder.build()
 
 valid_name = ".".join([dataset_name, args.language, "valid.json"])
 with open(os.path.join(work_dir, valid_name), 'w') as f:
     json.dump(valid_data, f)
 
 
-# we don't set a maximum length ONLY for test data
-test_data, ref_data = build_data(all_test, vocab, ref=True)
+test_data, ref_data = test_builder.build()
 test_name = ".".join([dataset_name, args.language, "test.json"])
 with open(os.path.join(work_dir, test_name), 'w') as f:
     json.dump(test_data, f)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import mmap
+import warnings
+from os import path, listdir
+from commitgen.storage import open_file, list_files
+
+PACK_FILE = "commits.pack"
+INDEX_FILE = "commits.index"
+
+
+def is_archive(data_path):
+    return path.isfile(path.join(data_path, PACK_FILE)) and \
+           path.isfile(path.join(data_path, INDEX_FILE))
+
+
+def pack_commits(data_path, archive_path=None):
+    """
+    Packs the json/<sha>.json and diff/<sha>.diff files of a crawled
+    commits folder into a single data file plus an offset index by sha.
+    Compressed files are stored decompressed.
+
+    :param data_path: folder containing the json and diff folders
+    :param archive_path: folder where the archive is written, defaults to data_path
+    :return: number of packed commits
+    """
+    archive_path = archive_path or data_path
+    json_path = path.join(data_path, "json")
+    diffs_path = path.join(data_path, "diff")
+
+    diff_files = list_files(listdir(diffs_path), '.diff')
+    json_files = list_files(listdir(json_path), '.json')
+    if not set(diff_files) == set(json_files):
+        warnings.warn("There were missing files")
+    # same order as an unpacked RawDataset, so commits get the same ids
+    shas = [sha for sha in json_files if sha in diff_files]
+
+    pack_filepath = path.join(archive_path, PACK_FILE)
+    index_filepath = path.join(archive_path, INDEX_FILE)
+
+    offset = 0
+    with open(pack_filepath + '.tmp', 'wb') as pack_file, \
+            open(index_filepath + '.tmp', 'w') as index_file:
+        for sha in shas:
+            entry = [sha]
+            for filepath in [path.join(json_path, json_files[sha]),
+                             path.join(diffs_path, diff_files[sha])]:
+                with open_file(filepath, 'rb') as f:
+                    data = f.read()
+                pack_file.write(data)
+                entry += [str(offset), str(len(data))]
+                offset += len(data)
+            index_file.write("\t".join(entry) + "\n")
+
+    os.rename(pack_filepath + '.tmp', pack_filepath)
+    os.rename(index_filepath + '.tmp', index_filepath)
+    return len(shas)
+
+
+class CommitArchive(object):
+    """
+    Read access to a packed commits archive. The data file is memory mapped,
+    so reading a commit does not need any extra open() or seek() calls.
+    """
+
+    def __init__(self, archive_path):
+        """
+
+        :param archive_path: folder containing the commits.pack and commits.index files
+        """
+        self.pack_path = path.join(archive_path, PACK_FILE)
+        self.index = {}
+        self.shas = []
+        with open(path.join(archive_path, INDEX_FILE), 'r') as index_file:
+            for line in index_file:
+                sha, json_offset, json_length, diff_offset, diff_length = line.split("\t")
+                self.index[sha] = (int(json_offset), int(json_length),
+                                   int(diff_offset), int(diff_length))
+                self.shas.append(sha)
+
+        with open(self.pack_path, 'rb') as pack_file:
+            if os.fstat(pack_file.fileno()).st_size > 0:
+                self.data = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = ""
+
+    def __contains__(self, sha):
+        return sha in self.index
+
+    def read_json(self, sha):
+        json_offset, json_length, _, _ = self.index[sha]
+        return self.data[json_offset:json_offset + json_length]
+
+    def read_diff(self, sha):
+        _, _, diff_offset, diff_length = self.index[sha]
+        return self.data[diff_offset:diff_offset + diff_length]
+
+    def diff_size(self, sha):
+        return self.index[sha][3]
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import collections
+import cPickle as pickle
+from pygments.token import string_to_tokentype
+
+
+class LRUCache(object):
+    """
+    Dictionary-like container that keeps at most max_size items, evicting
+    the least recently used one when full.
+    """
+
+    def __init__(self, max_size=1000):
+        """
+
+        :param max_size: maximum number of items kept in memory
+        """
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if self.max_size <= 0:
+            return
+        if key in self._data:
+            self._data.pop(key)
+        elif len(self._data) >= self.max_size:
+            self._data.popitem(last=False)
+        self._data[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+
+class DiffCache(object):
+    """
+    Persistent on-disk cache of parsed diffs. Each sha is stored in its own
+    pickle file together with the mtime and size of the diff file it was
+    parsed from, and is only reused while those are unchanged.
+    """
+
+    def __init__(self, cache_path):
+        """
+
+        :param cache_path: folder where cached entries are stored
+        """
+        self.cache_path = cache_path
+        if not os.path.isdir(cache_path):
+            os.makedirs(cache_path)
+
+    def _entry_path(self, sha):
+        return os.path.join(self.cache_path, sha + '.pickle')
+
+    @staticmethod
+    def _source_key(source_filepath):
+        stat = os.stat(source_filepath)
+        return stat.st_mtime, stat.st_size
+
+    def get(self, sha, source_filepath):
+        """
+        :return: the cached data, or None if missing or stale
+        """
+        try:
+            with open(self._entry_path(sha), 'rb') as f:
+                key, data = pickle.load(f)
+        except Exception:
+            return None
+        if key != self._source_key(source_filepath):
+            return None
+        return data
+
+    def set(self, sha, source_filepath, data):
+        entry_path = self._entry_path(sha)
+        tmp_path = entry_path + '.' + str(os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self._source_key(source_filepath), data), f,
+                        pickle.HIGHEST_PROTOCOL)
+        # atomic on POSIX, so concurrent readers never see partial entries
+        os.rename(tmp_path, entry_path)
+
+
+def _to_type_names(entries):
+    # token types are stored by name, so they map back to the pygments singletons
+    return [(key, (tuple(str(ttype) for ttype in types), tokens)) for key, (types, tokens) in entries]
+
+
+def _from_type_names(entries):
+    return [(key, (tuple(string_to_tokentype(ttype) for ttype in types), tokens))
+            for key, (types, tokens) in entries]
+
+
+class TokenCache(object):
+    """
+    Memo of the tokens of single code lines, keyed by language, ignored token
+    types and line content. The most recently used entries are kept in memory,
+    and can be saved to disk and loaded back in later runs.
+
+    Copies of the cache in worker processes record the entries they add, so
+    the workers can send them back to the cache of the parent process with
+    pop_new_entries and update.
+    """
+
+    def __init__(self, max_size=100000, cache_path=None):
+        """
+
+        :param max_size: maximum number of lines kept in memory
+        :param cache_path: if given, pickle file the cache is loaded from and saved to
+        """
+        self.memory = LRUCache(max_size=max_size)
+        self.cache_path = cache_path
+        # entries added since the last pop_new_entries, if recorded
+        self.new_entries = None
+        if cache_path and os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as f:
+                for key, value in _from_type_names(pickle.load(f)):
+                    self.memory[key] = value
+
+    @staticmethod
+    def key(language, ignore_types, code_line):
+        return language, tuple(sorted(str(ignore_type) for ignore_type in ignore_types)), code_line
+
+    def get(self, key):
+        """
+        :return: (types, tokens) tuple, or None if missing
+        """
+        return self.memory.get(key)
+
+    def set(self, key, value):
+        self.memory[key] = value
+        if self.new_entries is not None:
+            self.new_entries.append((key, value))
+
+    def record_new_entries(self):
+        """
+        Starts recording the entries added from now on, e.g. in a worker process
+        """
+        self.new_entries = []
+
+    def pop_new_entries(self):
+        """
+        :return: picklable list of the entries added since the last call, to pass to update
+        """
+        entries = self.new_entries or []
+        self.new_entries = []
+        return _to_type_names(entries)
+
+    def update(self, entries):
+        """
+        :param entries: entries returned by pop_new_entries, e.g. in a worker process
+        """
+        for key, value in _from_type_names(entries):
+            self.memory[key] = value
+
+    def save(self):
+        if not self.cache_path:
+            return
+        items = _to_type_names(self.memory._data.iteritems())
+        tmp_path = self.cache_path + '.' + str(os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.cache_path)
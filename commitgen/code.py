@@ -3,13 +3,16 @@
 
 import warnings
 import tokenize
+import os
+import time
 from token import tok_name
 from StringIO import StringIO
 from pygments.lexers.c_cpp import CppLexer
 from pygments.lexers.javascript import JavascriptLexer
 from pygments.lexers.jvm import JavaLexer
 from pygments.lexers.python import PythonLexer
-from multiprocessing import Process, Queue, cpu_count
+from commitgen.lexers import get_native_lexer
+from multiprocessing import Pool, cpu_count
 
 # import copy_reg
 # import types
@@ -22,64 +25,234 @@ from multiprocessing import Process, Queue, cpu_count
 # copy_reg.pickle(types.MethodType, _reduce_method)
 
 
+# number of lines lexed at a time by CodeLinesTokenizer when tokens are limited
+BUDGET_LINES = 16
+
+
+class TokenizationTimeout(Exception):
+    """
+    Raised when tokenizing takes longer than the given deadline
+    """
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.time() > deadline:
+        raise TokenizationTimeout("tokenization deadline exceeded")
+
+
+def get_lexer(language, engine="pygments"):
+    """
+    :param language: python, javascript, java or cpp
+    :param engine: pygments, or native for the regex lexers of commitgen.lexers
+    """
+    if engine == "native":
+        return get_native_lexer(language)
+    elif engine != "pygments":
+        raise NotImplementedError
+    if language == "python":
+        return PythonLexer()
+    elif language == "javascript":
+        return JavascriptLexer()
+    elif language == "cpp":
+        return CppLexer()
+    elif language == "java":
+        return JavaLexer()
+    else:
+        raise NotImplementedError
+
+
+# file extension -> language, used to route the files of a commit to their lexer
+EXTENSION_LANGUAGES = {".py": "python", ".pyw": "python",
+                       ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript",
+                       ".java": "java",
+                       ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".c++": "cpp", ".c": "cpp",
+                       ".hpp": "cpp", ".hh": "cpp", ".hxx": "cpp", ".h": "cpp"}
+
+
+def get_file_language(path):
+    """
+    :return: language of a file by its extension, or None if not supported
+    """
+    return EXTENSION_LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+
 def in_any(token_type, ignore_types):
     return any([token_type in ignore_type
                 for ignore_type in ignore_types])
 
 
-def worker(input, output):
-    for func, args in iter(input.get, 'STOP'):
-        result = func(*args)
-        output.put(result)
+class TypeFilter(dict):
+    """
+    Maps each token type to True when it is kept and False when it is one
+    of the ignored types (or a subtype), working it out with in_any only
+    the first time a type is seen
+    """
+
+    def __init__(self, ignore_types):
+        dict.__init__(self)
+        self.ignore_types = tuple(ignore_types)
+
+    def __missing__(self, token_type):
+        keep = not in_any(token_type, self.ignore_types)
+        self[token_type] = keep
+        return keep
+
+
+_type_filters = {}
+
+
+def get_type_filter(ignore_types):
+    """
+    Returns the TypeFilter of the ignored types, shared by all the tokenizers
+    """
+    ignore_types = tuple(ignore_types)
+    if ignore_types not in _type_filters:
+        _type_filters[ignore_types] = TypeFilter(ignore_types)
+    return _type_filters[ignore_types]
+
+
+_pool_tokenizer = None
+_pool_ignore_types = ()
 
-def do_task(tokenizer, i, code_line_chunk, return_types, ignore_types):
-    result = tokenizer.tokenize(code_line_chunk, return_types=return_types,
-                                ignore_types=ignore_types)
-    return (i, result)
+
+def record_token_cache_entries(tokenizer):
+    """
+    Makes the token cache of a tokenizer, if any, record the lines it lexes
+    from now on. Used on the copy of the tokenizer in a worker process.
+    """
+    token_cache = getattr(tokenizer, 'token_cache', None)
+    if token_cache is not None:
+        token_cache.record_new_entries()
+
+
+def pop_new_token_cache_entries(tokenizer):
+    """
+    :return: the entries recorded by the token cache of a tokenizer since the
+             last call, to send to the cache of the parent process, or None
+    """
+    token_cache = getattr(tokenizer, 'token_cache', None)
+    if token_cache is None:
+        return None
+    return token_cache.pop_new_entries()
+
+
+def _init_pool_worker(tokenizer, ignore_types):
+    global _pool_tokenizer, _pool_ignore_types
+    _pool_tokenizer = tokenizer
+    _pool_ignore_types = ignore_types
+    record_token_cache_entries(tokenizer)
+
+
+def _pool_tokenize(code_line_chunk):
+    tokens = _pool_tokenizer.tokenize(code_line_chunk, ignore_types=_pool_ignore_types)
+    return tokens, pop_new_token_cache_entries(_pool_tokenizer)
+
+
+class TokenizerPool(object):
+    """
+    Long-lived pool of tokenizer processes. The tokenizer (and its lexer) and
+    the ignored types are sent to each worker once when the pool starts,
+    chunks are then sent in batches and results come back in order.
+    """
+
+    def __init__(self, tokenizer, ignore_types=(), num_processes=cpu_count(), batch_size=64):
+        """
+
+        :param tokenizer: CodeChunkTokenizer or CodeLinesTokenizer
+        :param ignore_types: token types to ignore
+        :param num_processes: number of worker processes
+        :param batch_size: number of chunks sent to a worker at once
+        """
+        self.ignore_types = tuple(ignore_types)
+        self.num_processes = num_processes
+        self.batch_size = batch_size
+        # lines lexed by the workers are added to it
+        self.token_cache = getattr(tokenizer, 'token_cache', None)
+        self.pool = Pool(num_processes, initializer=_init_pool_worker,
+                         initargs=(tokenizer, self.ignore_types))
+
+    def imap_tokenize(self, code_line_chunks):
+        for tokens, new_entries in self.pool.imap(_pool_tokenize, code_line_chunks, chunksize=self.batch_size):
+            if new_entries:
+                self.token_cache.update(new_entries)
+            yield tokens
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_pool(tokenizer, ignore_types, num_processes):
+    """
+    Returns the pool of a tokenizer, only starting a new one on first use
+    or when the ignored types or number of processes change
+    """
+    pool = tokenizer.__dict__.get('_pool')
+    if pool is not None:
+        if pool.ignore_types == tuple(ignore_types) and pool.num_processes == num_processes:
+            return pool
+        pool.close()
+    tokenizer._pool = TokenizerPool(tokenizer, ignore_types=ignore_types,
+                                    num_processes=num_processes)
+    return tokenizer._pool
 
 class CodeChunkTokenizer():
 
-    def __init__(self, language="python"):
+    def __init__(self, language="python", engine="pygments"):
         """
 
         :param language: python, javascript, java or cpp
+        :param engine: lexer engine, pygments or native
         """
         self.language = language
-        if self.language == "python":
-            self.lexer = PythonLexer()
-        elif self.language == "javascript":
-            self.lexer = JavascriptLexer()
-        elif self.language == "cpp":
-            self.lexer = CppLexer()
-        elif self.language == "java":
-            self.lexer = JavaLexer()
-        else:
-            raise NotImplementedError
+        self.engine = engine
+        self.lexer = get_lexer(language, engine)
 
-    def tokenize(self, code_lines, return_types=False, ignore_types=()):
+    def tokenize(self, code_lines, return_types=False, ignore_types=(), max_tokens=None, deadline=None):
         #if self.language == "python":
         #    return self._python_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types)
         if self.language in ["python", "javascript", "cpp", "java"]:
-            return self._pygment_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types)
+            return self._pygment_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types,
+                                          max_tokens=max_tokens, deadline=deadline)
         else:
             raise NotImplementedError
 
-    def _pygment_tokenize(self, code_lines, return_types=False, ignore_types=()):
+    def _pygment_tokenize(self, code_lines, return_types=False, ignore_types=(), max_tokens=None,
+                          deadline=None):
         """
         :param code_lines:
         :param return_types:
         :param ignore_types:
+        :param max_tokens: if given, lexing stops as soon as there are more tokens than
+                           that, and only the tokens lexed until then are returned
+        :param deadline: if given, time.time() after which TokenizationTimeout is raised
         :return:
         """
         try:
             code = "".join([code_line.decode('ascii', errors='ignore')
                             for code_line in code_lines])
-            types, tokens= zip(*[(ttype, token) for ttype, token in self.lexer.get_tokens(code)
-                                  if not in_any(ttype, ignore_types)])
+            keep = get_type_filter(ignore_types)
+            types_tokens = []
+            for ttype, token in self.lexer.get_tokens(code):
+                if deadline is not None:
+                    check_deadline(deadline)
+                if keep[ttype]:
+                    types_tokens.append((ttype, token))
+                    if max_tokens is not None and len(types_tokens) > max_tokens:
+                        break
+            types, tokens= zip(*types_tokens)
             if return_types:
                 return tokens, types
             else:
                 return tokens
+        except TokenizationTimeout:
+            raise
         except Exception as e:
             warnings.warn(str(e))
             return []
@@ -124,94 +297,128 @@ class CodeChunkTokenizer():
         return tokens
 
     def batch_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        return list(self.imap_tokenize(code_line_chunks, ignore_types=ignore_types,
+                                       num_processes=num_processes))
 
-        results = [None] * len(code_line_chunks)
-
-        NUMBER_OF_PROCESSES = num_processes
-        TASKS = [(do_task, (self, i, code_line_chunk, False, ignore_types))
-                  for i, code_line_chunk in  enumerate(code_line_chunks)]
-
-        # Create queues
-        task_queue = Queue()
-        done_queue = Queue()
-
-        processes_container = []
-        # Start worker processes
-        for i in range(NUMBER_OF_PROCESSES):
-            p = Process(target=worker, args=(task_queue, done_queue))
-            processes_container.append(p)
-            p.start()
-
-        # Submit tasks
-        for task in TASKS:
-            task_queue.put(task)
-
-        # Get and print results
-        for _ in range(len(TASKS)):
-            i, result = done_queue.get()
-            results[i] = result
-
-        # Tell child processes to stop
-        for i in range(NUMBER_OF_PROCESSES):
-            task_queue.put('STOP')
+    def imap_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        """
+        Tokenizes the chunks in a persistent pool of worker processes, reused
+        across calls until close() is called. Results are yielded in order.
+        """
+        return get_pool(self, ignore_types, num_processes).imap_tokenize(code_line_chunks)
 
-        for process in processes_container:
-            process.terminate()
+    def close(self):
+        pool = self.__dict__.pop('_pool', None)
+        if pool is not None:
+            pool.close()
 
-        return results
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_pool', None)
+        return state
 
 class CodeLinesTokenizer():
 
-    def __init__(self, language="python"):
+    def __init__(self, language="python", token_cache=None, engine="pygments"):
         """
 
              :param language: python, javascript, java or cpp
+             :param token_cache: optional commitgen.cache.TokenCache memoizing the tokens of each line
+             :param engine: lexer engine, pygments or native
              """
         self.language = language
-        if self.language == "python":
-            self.lexer = PythonLexer()
-        elif self.language == "javascript":
-            self.lexer = JavascriptLexer()
-        elif self.language == "cpp":
-            self.lexer = CppLexer()
-        elif self.language == "java":
-            self.lexer = JavaLexer()
-        else:
-            raise NotImplementedError
+        self.token_cache = token_cache
+        self.engine = engine
+        self.lexer = get_lexer(language, engine)
 
-    def tokenize(self, code_lines, return_types=False, ignore_types=()):
+    def tokenize(self, code_lines, return_types=False, ignore_types=(), max_tokens=None, deadline=None):
         #if self.language == "python":
         #    return self._python_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types)
         if self.language in ["python", "javascript", "cpp", "java"]:
-            return self._pygment_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types)
+            return self._pygment_tokenize(code_lines, return_types=return_types, ignore_types=ignore_types,
+                                          max_tokens=max_tokens, deadline=deadline)
         else:
             raise NotImplementedError
 
-    def _pygment_tokenize(self, code_lines, return_types=False, ignore_types=()):
+    def _pygment_tokenize(self, code_lines, return_types=False, ignore_types=(), max_tokens=None,
+                          deadline=None):
         """
         Recommended ignore_types ('LINE_COMMENT', 'BLOCK_COMMENT'
         :param code_lines:
         :param return_types:
         :param ignore_types:
+        :param max_tokens: if given, lines are lexed BUDGET_LINES at a time and lexing stops
+                           as soon as there are more tokens than that, returning the tokens
+                           of the lines lexed until then
+        :param deadline: if given, time.time() after which TokenizationTimeout is raised
         :return:
         """
         tokens = []
         types = []
-        for code_line in code_lines:
-            try:
-                code_line = code_line.strip().decode('utf-8').encode('ascii', 'replace')
-                ttypes, ttokens = zip(*[(ttype, token) for ttype, token in self.lexer.get_tokens(code_line)
-                                        if not in_any(ttype, ignore_types)])
+        if max_tokens is None:
+            blocks = [code_lines]
+        else:
+            blocks = [code_lines[i:i + BUDGET_LINES] for i in range(0, len(code_lines), BUDGET_LINES)]
+        for block in blocks:
+            for ttypes, ttokens in self._lex_lines(block, ignore_types, deadline):
                 tokens += ttokens
                 if return_types:
                     types += ttypes
-            except Exception as e:
-                warnings.warn(str(e))
+            if max_tokens is not None and len(tokens) > max_tokens:
+                break
         if return_types:
             return tokens, types
         else:
             return tokens
 
+    def _lex_lines(self, code_lines, ignore_types, deadline=None):
+        """
+        :return: (types, tokens) of each line that could be lexed
+        """
+        lines = []
+        for code_line in code_lines:
+            try:
+                lines.append(code_line.strip().decode('utf-8').encode('ascii', 'replace'))
+            except Exception as e:
+                warnings.warn(str(e))
+        results = [None] * len(lines)
+        keys = None
+        if self.token_cache is not None:
+            keys = [self.token_cache.key(self._cache_language(), ignore_types, line)
+                    for line in lines]
+            results = [self.token_cache.get(key) for key in keys]
+        for i in [i for i, result in enumerate(results) if result is None]:
+            try:
+                results[i] = self._lex_line(lines[i], ignore_types, deadline)
+            except TokenizationTimeout:
+                raise
+            except Exception as e:
+                warnings.warn(str(e))
+                continue
+            if keys is not None:
+                self.token_cache.set(keys[i], results[i])
+        return [result for result in results if result is not None]
+
+    def _cache_language(self):
+        # lines lexed by another engine may give other tokens
+        if self.engine == "pygments":
+            return self.language
+        return self.language + ":" + self.engine
+
+    def _lex_line(self, code_line, ignore_types, deadline=None):
+        """
+        :return: (types, tokens) tuples of the line tokens that are not ignored
+        """
+        keep = get_type_filter(ignore_types)
+        ttypes, ttokens = [], []
+        for ttype, token in self.lexer.get_tokens(code_line):
+            if deadline is not None:
+                check_deadline(deadline)
+            if keep[ttype]:
+                ttypes.append(ttype)
+                ttokens.append(token)
+        return tuple(ttypes), tuple(ttokens)
+
     def _python_tokenize(self, code_lines, return_types=False, ignore_types=()):
         """
         """
@@ -255,41 +462,115 @@ class CodeLinesTokenizer():
             return []
 
     def batch_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        return list(self.imap_tokenize(code_line_chunks, ignore_types=ignore_types,
+                                       num_processes=num_processes))
+
+    def imap_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        """
+        Tokenizes the chunks in a persistent pool of worker processes, reused
+        across calls until close() is called. Results are yielded in order.
+        """
+        return get_pool(self, ignore_types, num_processes).imap_tokenize(code_line_chunks)
 
-        results = [None] * len(code_line_chunks)
+    def close(self):
+        pool = self.__dict__.pop('_pool', None)
+        if pool is not None:
+            pool.close()
 
-        NUMBER_OF_PROCESSES = num_processes
-        TASKS = [(do_task, (self, i, code_line_chunk, False, ignore_types))
-                 for i, code_line_chunk in enumerate(code_line_chunks)]
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_pool', None)
+        return state
 
-        # Create queues
-        task_queue = Queue()
-        done_queue = Queue()
 
-        processes_container = []
-        # Start worker processes
-        for i in range(NUMBER_OF_PROCESSES):
-            p = Process(target=worker, args=(task_queue, done_queue))
-            processes_container.append(p)
-            p.start()
+class AutoTokenizer(object):
+    """
+    Tokenizes each file with the lexer of its language, picked from the file
+    extension. Code lines must carry their file path, as the
+    commitgen.diff.SourceLine extracted with with_paths=True. Lines of
+    files in unsupported languages produce no tokens.
+    """
 
-        # Submit tasks
-        for task in TASKS:
-            task_queue.put(task)
+    def __init__(self, tokenizer_class=CodeLinesTokenizer, **kwargs):
+        """
 
-        # Get and print results
-        for _ in range(len(TASKS)):
-            i, result = done_queue.get()
-            results[i] = result
+        :param tokenizer_class: CodeChunkTokenizer or CodeLinesTokenizer
+        :param kwargs: arguments of the tokenizer class other than the language
+        """
+        self.tokenizer_class = tokenizer_class
+        self.kwargs = kwargs
+        # language -> tokenizer, created on first use and reused
+        self.tokenizers = {}
+
+    @property
+    def token_cache(self):
+        # shared by the tokenizers of every language
+        return self.kwargs.get('token_cache')
+
+    def get_tokenizer(self, language):
+        tokenizer = self.tokenizers.get(language)
+        if tokenizer is None:
+            tokenizer = self.tokenizer_class(language=language, **self.kwargs)
+            self.tokenizers[language] = tokenizer
+        return tokenizer
+
+    def tokenize(self, code_lines, return_types=False, ignore_types=(), max_tokens=None, deadline=None):
+        tokens = []
+        types = []
+        for language, file_lines in self._split_files(code_lines):
+            if language is None:
+                continue
+            if max_tokens is not None and len(tokens) > max_tokens:
+                break
+            result = self.get_tokenizer(language).tokenize(
+                file_lines, return_types=return_types, ignore_types=ignore_types,
+                max_tokens=None if max_tokens is None else max_tokens - len(tokens), deadline=deadline)
+            if return_types:
+                if result:
+                    tokens += result[0]
+                    types += result[1]
+            else:
+                tokens += result
+        if return_types:
+            return tokens, types
+        return tokens
 
-        # Tell child processes to stop
-        for i in range(NUMBER_OF_PROCESSES):
-            task_queue.put('STOP')
+    def _split_files(self, code_lines):
+        """
+        :return: (language, lines) of each run of consecutive lines of the same file
+        """
+        runs = []
+        path = None
+        for code_line in code_lines:
+            line_path = getattr(code_line, 'path', None)
+            if not runs or line_path != path:
+                path = line_path
+                runs.append((get_file_language(path) if path else None, []))
+            runs[-1][1].append(code_line)
+        return runs
 
-        for process in processes_container:
-            process.terminate()
+    def batch_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        return list(self.imap_tokenize(code_line_chunks, ignore_types=ignore_types,
+                                       num_processes=num_processes))
 
-        return results
+    def imap_tokenize(self, code_line_chunks, ignore_types=(), num_processes=cpu_count()):
+        """
+        Tokenizes the chunks in a persistent pool of worker processes, reused
+        across calls until close() is called. Results are yielded in order.
+        """
+        return get_pool(self, ignore_types, num_processes).imap_tokenize(code_line_chunks)
+
+    def close(self):
+        pool = self.__dict__.pop('_pool', None)
+        if pool is not None:
+            pool.close()
+        for tokenizer in self.tokenizers.values():
+            tokenizer.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_pool', None)
+        return state
 
 
                 # def _js_tokenize(self, code_lines, return_types=False, ignore_types=()):
@@ -6,7 +6,18 @@ import json
 from unidiff import PatchSet, PatchedFile
 import warnings
 import collections
+import itertools
 import random
+import struct
+import time
+import cPickle as pickle
+from multiprocessing import Pool
+from commitgen.cache import LRUCache, DiffCache
+from commitgen.diff import DiffSet, parse_diff
+from commitgen.archive import CommitArchive, is_archive
+from commitgen.storage import open_file, list_files, project_metadata, COMPRESSIONS
+from commitgen.index import select_shas, check_index, default_index_path
+from commitgen.code import TokenizationTimeout, record_token_cache_entries, pop_new_token_cache_entries
 
 
 PAD = 1
@@ -15,112 +26,586 @@ START = 3
 END = 4
 NEW_FILE = 5
 
+class LazyDict(object):
+    """
+    Read-only mapping from sha to an object that is only loaded when
+    accessed, keeping the most recently used ones in a bounded cache.
+    """
+
+    def __init__(self, shas, load_fn, cache_size=1000):
+        """
+
+        :param shas: shas that can be loaded
+        :param load_fn: function mapping a sha to the loaded object
+        :param cache_size: maximum number of loaded objects kept in memory
+        """
+        self.shas = set(shas)
+        self.load_fn = load_fn
+        self.cache = LRUCache(max_size=cache_size)
+        self.failed = set()
+
+    def __len__(self):
+        return len(self.shas)
+
+    def __iter__(self):
+        return iter(self.shas)
+
+    def __contains__(self, sha):
+        return sha in self.shas
+
+    def __getitem__(self, sha):
+        if sha in self.cache:
+            return self.cache[sha]
+        if sha not in self.shas or sha in self.failed:
+            raise KeyError(sha)
+        try:
+            value = self.load_fn(sha)
+        except KeyError:
+            # already reported by the mapping load_fn reads from
+            self.failed.add(sha)
+            raise
+        except Exception as e:
+            warnings.warn("Problem in sha " + sha)
+            self.failed.add(sha)
+            raise KeyError(sha)
+        self.cache[sha] = value
+        return value
+
+    def get(self, sha, default=None):
+        try:
+            return self[sha]
+        except KeyError:
+            return default
+
+
+_loader_dataset = None
+
+
+def _init_loader(raw_dataset):
+    global _loader_dataset
+    _loader_dataset = raw_dataset
+
+
+def _load_commit(sha):
+    try:
+        diff_data = _loader_dataset.load_diff(sha)
+        json_data = _loader_dataset.load_metadata(sha)
+        return sha, diff_data, json_data, compute_stats(diff_data, json_data), False
+    except DiffTooLarge:
+        return sha, None, None, None, True
+    except Exception:
+        return sha, None, None, None, False
+
+
+# entry of the diff cache, the sizes of the raw diff are stored with the parsed
+# diff so the size limits are checked without reading it. diff is None for
+# diffs that were over the limits when cached
+CachedDiff = collections.namedtuple('CachedDiff', ['bytes', 'lines', 'diff'], verbose=False)
+
+
+class DiffTooLarge(KeyError):
+    """
+    Raised when a diff is over the size limits of a RawDataset. It is a
+    KeyError so the commit is left out like any other missing commit.
+    """
+
+
+CommitStats = collections.namedtuple('CommitStats', ['added_lines', 'removed_lines', 'context_lines',
+                                                     'modified_files', 'added_files', 'removed_files',
+                                                     'message_length'])
+
+
+def compute_stats(diff_file, metadata):
+    """
+    Computes the line and file counts of a commit, so commits can be filtered
+    without walking the hunks of its diff again.
+
+    :param diff_file: unidiff.PatchSet or commitgen.diff.DiffSet
+    :param metadata: commit metadata
+    :return: CommitStats, where message_length is the number of whitespace separated words
+    """
+    added_lines, removed_lines, context_lines = 0, 0, 0
+    modified_files, added_files, removed_files = 0, 0, 0
+    for patched_file in diff_file:
+        is_added_file = patched_file.is_added_file
+        is_removed_file = patched_file.is_removed_file
+        if is_added_file:
+            added_files += 1
+        elif is_removed_file:
+            removed_files += 1
+        else:
+            modified_files += 1
+        for hunk in patched_file:
+            for line in hunk:
+                # counted as in get_added_lines and get_removed_lines
+                if line.is_added:
+                    if not is_removed_file:
+                        added_lines += 1
+                elif line.is_removed:
+                    if not is_added_file:
+                        removed_lines += 1
+                elif line.is_context:
+                    context_lines += 1
+    try:
+        message_length = len(metadata['commit']['message'].split())
+    except (KeyError, TypeError):
+        message_length = 0
+    return CommitStats(added_lines, removed_lines, context_lines,
+                       modified_files, added_files, removed_files,
+                       message_length)
+
+
 class RawDataset(object):
 
-    def __init__(self, data_path):
-        json_path = path.join(data_path, "json")
-        diffs_path = path.join(data_path, "diff")
-        diff_files = listdir(diffs_path)
-        json_files = listdir(json_path)
+    def __init__(self, data_path, lazy=False, cache_size=1000, cache_path=None, num_workers=1,
+                 parser="unidiff", metadata_fields=None, exclude_shas=None, max_diff_bytes=None,
+                 max_diff_lines=None):
+        """
 
-        shas_diff = [f.replace('.diff', '') for f in diff_files]
-        shas_json = [f.replace('.json', '') for f in json_files]
+        :param data_path: folder containing the json and diff folders, or a packed
+                          archive written by commitgen.archive.pack_commits. Files in
+                          the json and diff folders may be gzip or xz compressed
+        :param lazy: if True, only index the shas and load diffs and metadata on access
+        :param cache_size: number of diffs/metadata kept in memory in lazy mode
+        :param cache_path: if given, folder where parsed diffs are cached across runs, with
+                           the sizes of the raw diffs so cached commits are checked against
+                           the size limits without reading them. Diffs are then returned as
+                           commitgen.diff.DiffSet
+        :param num_workers: number of processes used to parse the diffs up front
+        :param parser: "unidiff" to parse diffs into unidiff.PatchSet, or "fast" to use
+                       commitgen.diff.parse_diff, which returns a lighter DiffSet
+        :param metadata_fields: if given, dotted paths of the only metadata fields kept
+                                in memory, see commitgen.storage.DEFAULT_METADATA_FIELDS
+        :param exclude_shas: if given, shas left out of the dataset, they are never loaded
+        :param max_diff_bytes: if given, commits whose raw diff is larger are skipped
+                               before their diff is decoded or parsed
+        :param max_diff_lines: if given, commits whose raw diff has more lines are skipped
+                               before their diff is decoded or parsed
+        """
+        if parser not in ["unidiff", "fast"]:
+            raise NotImplementedError
+        self.parser = parser
+        self.metadata_fields = metadata_fields
+        self.max_diff_bytes = max_diff_bytes
+        self.max_diff_lines = max_diff_lines
+        # number of commits skipped by the size limits
+        self.skipped = 0
+        self.data_path = data_path
+        self.diff_cache = DiffCache(cache_path) if cache_path else None
+        self.json_path = path.join(data_path, "json")
+        self.diffs_path = path.join(data_path, "diff")
 
-        if not set(shas_diff) == set(shas_json):
-            warnings.warn("There were missing files")
-            self.shas = list(set(shas_diff) & set(shas_json))
+        if is_archive(data_path):
+            self.archive = CommitArchive(data_path)
+            self.shas = self.archive.shas
         else:
-          self.shas = shas_json
-        
+            self.archive = None
+            # sha -> file name, which may carry a .gz or .xz extension
+            self.diff_files = list_files(listdir(self.diffs_path), '.diff')
+            self.json_files = list_files(listdir(self.json_path), '.json')
+
+            shas_diff = list(self.diff_files)
+            shas_json = list(self.json_files)
+
+            if not set(shas_diff) == set(shas_json):
+                warnings.warn("There were missing files")
+                self.shas = list(set(shas_diff) & set(shas_json))
+            else:
+              self.shas = shas_json
+
+        if exclude_shas:
+            self.shas = [sha for sha in self.shas if sha not in exclude_shas]
+
+        if lazy:
+            self.diff = LazyDict(self.shas, self.load_diff, cache_size=cache_size)
+            self.metadata = LazyDict(self.shas, self.load_metadata, cache_size=cache_size)
+            self.stats = LazyDict(self.shas, self.load_stats, cache_size=len(self.shas))
+            return
+
         self.diff = {}
         self.metadata = {}
+        self.stats = {}
 
-        for sha in self.shas:
-            diff_filepath = path.join(diffs_path, sha + '.diff')
+        if num_workers > 1:
+            pool = Pool(num_workers, initializer=_init_loader, initargs=(self,))
             try:
-                with open(diff_filepath, 'r') as diff_file:
-                    diff = diff_file.read().decode('utf-8')
-                    diff_data = PatchSet(diff.splitlines())
-
-                json_filepath = path.join(json_path, sha + '.json')
-                with open(json_filepath, 'r') as json_file:
-                    json_data = json.load(json_file)
+                for sha, diff_data, json_data, stats, skipped in pool.imap(_load_commit, self.shas, chunksize=32):
+                    if skipped:
+                        self.skipped += 1
+                    elif diff_data is None:
+                        warnings.warn("Problem in sha " + sha)
+                    else:
+                        self.diff[sha] = diff_data
+                        self.metadata[sha] = json_data
+                        self.stats[sha] = stats
+            finally:
+                pool.close()
+                pool.join()
+            return
 
+        for sha in self.shas:
+            try:
+                diff_data = self.load_diff(sha)
+                json_data = self.load_metadata(sha)
                 self.diff[sha] = diff_data
                 self.metadata[sha] = json_data
+                self.stats[sha] = compute_stats(diff_data, json_data)
+            except DiffTooLarge:
+                pass
             except Exception as e:
                 warnings.warn("Problem in sha " + sha)
 
+    def diff_source(self, sha):
+        """
+        File the diff of sha is read from, used to invalidate cached entries
+        """
+        if self.archive:
+            return self.archive.pack_path
+        return path.join(self.diffs_path, self.diff_files[sha])
+
+    def diff_size(self, sha):
+        """
+        :return: size in bytes of the raw diff of sha, or None if it is compressed
+        """
+        if self.archive:
+            return self.archive.diff_size(sha)
+        filename = self.diff_files[sha]
+        if filename.rsplit('.', 1)[-1] in COMPRESSIONS:
+            return None
+        return path.getsize(path.join(self.diffs_path, filename))
+
+    def _check_size(self, sha, size, lines=None):
+        """
+        Raises DiffTooLarge if the raw diff of sha is over the size limits.
+        Limits whose count is None are not checked.
+        """
+        too_large = self.max_diff_bytes is not None and size is not None and size > self.max_diff_bytes
+        too_large = too_large or (self.max_diff_lines is not None and lines is not None and
+                                  lines > self.max_diff_lines)
+        if too_large:
+            self.skipped += 1
+            raise DiffTooLarge(sha)
+
+    def read_diff(self, sha):
+        if self.archive:
+            return self.archive.read_diff(sha)
+        with open_file(path.join(self.diffs_path, self.diff_files[sha])) as diff_file:
+            return diff_file.read()
+
+    def read_metadata(self, sha):
+        if self.archive:
+            return self.archive.read_json(sha)
+        with open_file(path.join(self.json_path, self.json_files[sha])) as json_file:
+            return json_file.read()
+
+    def load_diff(self, sha):
+        limited = self.max_diff_bytes is not None or self.max_diff_lines is not None
+        cached = None
+        if self.diff_cache:
+            cached = self.diff_cache.get(sha, self.diff_source(sha))
+            if not isinstance(cached, CachedDiff):
+                # missing, stale, or cached without the sizes of the raw diff
+                cached = None
+        if cached is not None:
+            self._check_size(sha, cached.bytes, cached.lines)
+            if cached.diff is not None:
+                return DiffSet.from_tuples(cached.diff)
+        elif limited:
+            # the byte limit is checked on the file size when known, before reading it
+            self._check_size(sha, self.diff_size(sha))
+        raw_diff = self.read_diff(sha)
+        if limited or self.diff_cache:
+            size, lines = len(raw_diff), raw_diff.count('\n')
+            try:
+                self._check_size(sha, size, lines)
+            except DiffTooLarge:
+                if self.diff_cache:
+                    # so later runs skip it without reading it either
+                    self.diff_cache.set(sha, self.diff_source(sha), CachedDiff(size, lines, None))
+                raise
+        diff = raw_diff.decode('utf-8')
+        if self.parser == "fast":
+            diff_data = parse_diff(diff.splitlines())
+        else:
+            diff_data = PatchSet(diff.splitlines())
+        if self.diff_cache:
+            if not isinstance(diff_data, DiffSet):
+                diff_data = DiffSet.from_patchset(diff_data)
+            self.diff_cache.set(sha, self.diff_source(sha), CachedDiff(size, lines, diff_data.to_tuples()))
+        return diff_data
+
+    def load_stats(self, sha):
+        return compute_stats(self.diff[sha], self.metadata[sha])
+
+    def load_metadata(self, sha):
+        metadata = json.loads(self.read_metadata(sha))
+        if self.metadata_fields:
+            metadata = project_metadata(metadata, self.metadata_fields)
+        return metadata
+
 
-Commit = collections.namedtuple('Commit', ['sha', 'metadata', 'diff_file'], verbose=False)
+Commit = collections.namedtuple('Commit', ['sha', 'metadata', 'diff_file', 'stats'], verbose=False)
 ParsedCommit = collections.namedtuple('ParsedCommit', ['id', 'code', 'nl_tokens', 'code_tokens'], verbose=False)
+QuarantinedCommit = collections.namedtuple('QuarantinedCommit', ['sha', 'seconds', 'code_lines'], verbose=False)
 
 
-def extract_commits(raw_dataset, code_lines_extractor, filters=()):
+def iter_commits(raw_dataset, query=None, seen=None):
     """
+    Generator over the Commit objects of a RawDataset, skipping shas that
+    could not be loaded.
 
     :param raw_dataset: RawDataset object containing commit metadata and dif files
-    :param get_code_lines_fn: function to extract code lines from the diff file
-    :param filters: list of filter functions to a commit
-    :return:
+    :param query: SQL condition used to select shas from the dataset index
+    :param seen: if given, set the sha of each loaded commit is added to
     """
-    commits = []
-    for sha in raw_dataset.shas:
+    shas = raw_dataset.shas
+    if query:
+        index_path = default_index_path(raw_dataset.data_path)
+        check_index(index_path, shas)
+        selected = select_shas(index_path, query)
+        shas = [sha for sha in shas if sha in selected]
+    for sha in shas:
         try:
             diff_file = raw_dataset.diff[sha]
             metadata = raw_dataset.metadata[sha]
-            commit = Commit(sha, metadata, diff_file)
+            stats = raw_dataset.stats[sha]
+        except KeyError:
+            continue
+        if seen is not None:
+            seen.add(sha)
+        yield Commit(sha, metadata, diff_file, stats)
+
+
+def iter_extract_commits(raw_dataset, code_lines_extractor, filters=(), query=None, seen=None):
+    """
+    Generator version of extract_commits, yields one (sha, message, code_lines)
+    tuple at a time.
+
+    :param raw_dataset: RawDataset object containing commit metadata and dif files
+    :param code_lines_extractor: object to extract code lines from the diff file
+    :param filters: list of filter functions to a commit
+    :param query: SQL condition used to select shas from the dataset index
+                  (see commitgen.index) before any diff is loaded
+    :param seen: if given, set the sha of each loaded commit is added to, including
+                 the commits removed by the filters
+    """
+    for commit in iter_commits(raw_dataset, query=query, seen=seen):
+        try:
             if all([func(commit) for func in filters]):
                 message = commit.metadata['commit']['message']
                 code_lines = code_lines_extractor.get_lines(commit.diff_file)
-                commits.append((sha, message, code_lines))
+                yield commit.sha, message, code_lines
         except KeyError:
             pass
-    return commits
 
 
-def parse_commits(commits, nl_tokenizer, code_tokenizer, ignore_types=None, filters=(), marker=None):
+def extract_commits(raw_dataset, code_lines_extractor, filters=(), query=None, seen=None):
+    """
+
+    :param raw_dataset: RawDataset object containing commit metadata and dif files
+    :param get_code_lines_fn: function to extract code lines from the diff file
+    :param filters: list of filter functions to a commit
+    :param query: SQL condition used to select shas from the dataset index
+    :param seen: if given, set the sha of each loaded commit is added to
+    :return:
+    """
+    return list(iter_extract_commits(raw_dataset, code_lines_extractor,
+                                     filters=filters, query=query, seen=seen))
+
+
+def parse_commit(i, message, code_lines, nl_tokenizer, code_tokenizer, ignore_types=None, marker=None,
+                 max_tokens=None, time_budget=None):
+    """
+    Parses a single extracted commit
+
+    :param max_tokens: if given, code lexing stops as soon as the commit has more code
+                       tokens than that, leaving an incomplete but too long commit
+    :param time_budget: if given, seconds after which code lexing raises
+                        commitgen.code.TokenizationTimeout
+    :return: ParsedCommit with id i
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+    parsed_nl = nl_tokenizer.tokenize(message)
+    if marker:
+        parsed_code = []
+        code_lines_chunk = []
+        for code_line in code_lines:
+            if max_tokens is not None and len(parsed_code) > max_tokens:
+                code_lines_chunk = []
+                break
+            if code_line != marker:
+                code_lines_chunk.append(code_line)
+            else:
+                parsed_code.append("NEW_FILE")
+                parsed_code += _tokenize_chunk(code_tokenizer, code_lines_chunk, ignore_types,
+                                               max_tokens, len(parsed_code), deadline)
+                code_lines_chunk = []
+        if code_lines_chunk:
+            parsed_code += _tokenize_chunk(code_tokenizer, code_lines_chunk, ignore_types,
+                                           max_tokens, len(parsed_code), deadline)
+    else:
+        parsed_code = _tokenize_chunk(code_tokenizer, code_lines, ignore_types, max_tokens, 0, deadline)
+    return ParsedCommit(i, '\n'.join(code_lines), parsed_nl, parsed_code)
+
+
+def _tokenize_chunk(code_tokenizer, code_lines, ignore_types, max_tokens, num_tokens, deadline):
+    # tokenizers without a budget or deadline are still supported
+    kwargs = {}
+    if max_tokens is not None:
+        kwargs['max_tokens'] = max_tokens - num_tokens
+    if deadline is not None:
+        kwargs['deadline'] = deadline
+    return code_tokenizer.tokenize(code_lines, ignore_types=ignore_types, **kwargs)
+
+
+def _timed_parse_commit(i, sha, message, code_lines, nl_tokenizer, code_tokenizer, ignore_types,
+                        marker, max_tokens, time_budget):
+    """
+    :return: (ParsedCommit, None), or (None, QuarantinedCommit) if it took longer than time_budget
+    """
+    start = time.time()
+    try:
+        return parse_commit(i, message, code_lines, nl_tokenizer, code_tokenizer,
+                            ignore_types=ignore_types, marker=marker, max_tokens=max_tokens,
+                            time_budget=time_budget), None
+    except TokenizationTimeout:
+        return None, QuarantinedCommit(sha, time.time() - start, len(code_lines))
+
+
+_parse_args = None
+
+
+def _init_parser(nl_tokenizer, code_tokenizer, ignore_types, marker, max_tokens, time_budget):
+    global _parse_args
+    _parse_args = (nl_tokenizer, code_tokenizer, ignore_types, marker, max_tokens, time_budget)
+    record_token_cache_entries(code_tokenizer)
+
+
+def _parse_commit(task):
+    i, sha, message, code_lines = task
+    parsed_commit, quarantined = _timed_parse_commit(i, sha, message, code_lines, *_parse_args)
+    # lines lexed in the worker, added to the token cache of the parent
+    return parsed_commit, quarantined, pop_new_token_cache_entries(_parse_args[1])
+
+
+def iter_parse_commits(commits, nl_tokenizer, code_tokenizer, ignore_types=None, filters=(), marker=None,
+                       num_workers=1, start=0, max_tokens=None, time_budget=None, quarantine=None):
+    """
+    Generator version of parse_commits, accepts any iterable of extracted
+    commits (sha, message, code_lines) and yields one ParsedCommit at a time.
+    Commits get consecutive ids from start, whether they pass the filters or not.
+    """
+    token_cache = getattr(code_tokenizer, 'token_cache', None)
+    if num_workers > 1:
+        # filters may be lambdas, so they are applied here and not in the workers
+        pool = Pool(num_workers, initializer=_init_parser,
+                    initargs=(nl_tokenizer, code_tokenizer, ignore_types, marker, max_tokens, time_budget))
+        tasks = ((i, sha, message, code_lines) for i, (sha, message, code_lines) in enumerate(commits, start))
+        results = pool.imap(_parse_commit, tasks, chunksize=16)
+    else:
+        results = (_timed_parse_commit(i, sha, message, code_lines, nl_tokenizer, code_tokenizer,
+                                       ignore_types, marker, max_tokens, time_budget) + (None,)
+                   for i, (sha, message, code_lines) in enumerate(commits, start))
+    try:
+        for parsed_commit, quarantined, new_entries in results:
+            if new_entries:
+                token_cache.update(new_entries)
+            if quarantined is not None:
+                if quarantine is not None:
+                    quarantine.append(quarantined)
+                continue
+            if all([func(parsed_commit) for func in filters]):
+                yield parsed_commit
+    finally:
+        if num_workers > 1:
+            pool.close()
+            pool.join()
+
+
+def parse_commits(commits, nl_tokenizer, code_tokenizer, ignore_types=None, filters=(), marker=None,
+                  num_workers=1, start=0, max_tokens=None, time_budget=None, quarantine=None):
     """
     Parses a list of extracted commits (sha, message, code_lines) tuples.
 
     :param commits_data: (sha, message, code_lines)
     :param language: (str) the language of the code in the commits
+    :param num_workers: number of processes the commits are sharded across. The
+                        result has the same order and ids as the serial path
+    :param start: id of the first commit, e.g. to append to previously parsed commits
+    :param max_tokens: if given, code lexing of a commit stops once it has more code tokens
+                       than that. Use with a filter dropping those commits
+    :param time_budget: if given, seconds a commit may take to tokenize, slower commits
+                        are left out
+    :param quarantine: if given, list a QuarantinedCommit (sha, seconds, number of code
+                       lines) is appended to for each commit left out by time_budget
     :return: list of tuples of the form (sha, code, parsed_nl, parsed_code)
     """
-    parsed_commits = []
-    for i, (sha, message, code_lines) in enumerate(commits):
-        parsed_nl = nl_tokenizer.tokenize(message)
-        if marker:
-            parsed_code = []
-            code_lines_chunk = []
-            for code_line in code_lines:
-                if code_line != marker:
-                    code_lines_chunk.append(code_line)
-                else:
-                    parsed_code.append("NEW_FILE")
-                    parsed_code += code_tokenizer.tokenize(code_lines_chunk, ignore_types=ignore_types)
-                    code_lines_chunk = []
-            if code_lines_chunk:
-                parsed_code += code_tokenizer.tokenize(code_lines_chunk, ignore_types=ignore_types)
-        else:
-            parsed_code = code_tokenizer.tokenize(code_lines, ignore_types=ignore_types)
-        parsed_commit = ParsedCommit(i, '\n'.join(code_lines), parsed_nl, parsed_code)
-        if all([func(parsed_commit) for func in filters]):
-            parsed_commits.append(parsed_commit)
-    return parsed_commits
+    return list(iter_parse_commits(commits, nl_tokenizer, code_tokenizer,
+                                   ignore_types=ignore_types, filters=filters,
+                                   marker=marker, num_workers=num_workers, start=start,
+                                   max_tokens=max_tokens, time_budget=time_budget,
+                                   quarantine=quarantine))
 
 
-def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
+def extract_parse_views(raw_dataset, code_lines_extractor, nl_tokenizer, code_tokenizer, views,
+                        ignore_types=None, filters=(), marker=None, query=None):
     """
-    Generates the vocabularies and index_to_token mappings for both code an nl
+    Extracts and parses the commits of several views of the same dataset in
+    a single pass. Each commit is extracted and tokenized at most once, no
+    matter how many views it belongs to. The result for each view is the same
+    as calling extract_commits with its filters followed by parse_commits.
 
-    :param parsed_commits: list of tuples (sha, parsed_nl, parsed_code)
-    :param code_unk_threshold: minimum freq. to consider a code token as UNKNOWN
-    :param nl_unk_threshold: minimum freq. to consider a nl token as UNKNOWN
-    :param language: (str) language
-    :return: vocab
+    :param raw_dataset: RawDataset object containing commit metadata and dif files
+    :param code_lines_extractor: object to extract code lines from the diff file
+    :param nl_tokenizer: tokenizer for the commit messages
+    :param code_tokenizer: tokenizer for the code lines
+    :param views: dict from view name to its list of filter functions to a commit
+    :param ignore_types: token types ignored by the code tokenizer
+    :param filters: list of filter functions to a parsed commit, applied to all views
+    :param marker: new file marker
+    :param query: SQL condition used to select shas from the dataset index
+    :return: dict from view name to list of ParsedCommit
     """
+    parsed_views = dict((name, []) for name in views)
+    # number of extracted commits per view, used as ParsedCommit ids
+    extracted = collections.Counter()
+    for commit in iter_commits(raw_dataset, query=query):
+        names = []
+        for name, view_filters in views.items():
+            try:
+                if all([func(commit) for func in view_filters]):
+                    names.append(name)
+            except KeyError:
+                # as with extract_commits, the commit is only left out of this view
+                pass
+        if not names:
+            continue
+        try:
+            message = commit.metadata['commit']['message']
+            code_lines = code_lines_extractor.get_lines(commit.diff_file)
+        except KeyError:
+            continue
+        parsed_commit = parse_commit(None, message, code_lines, nl_tokenizer, code_tokenizer,
+                                     ignore_types=ignore_types, marker=marker)
+        for name in names:
+            view_parsed_commit = parsed_commit._replace(id=extracted[name])
+            extracted[name] += 1
+            if all([func(view_parsed_commit) for func in filters]):
+                parsed_views[name].append(view_parsed_commit)
+    return parsed_views
+
+
+VocabCounts = collections.namedtuple('VocabCounts', ['nl', 'code'], verbose=False)
+
+
+def count_vocab(parsed_commits):
+    """
+    Counts the nl and code tokens of a shard of parsed commits. Counts of
+    different shards are merged with merge_vocab_counts.
 
+    :param parsed_commits: iterable of ParsedCommit, e.g. from load_stream
+    :return: VocabCounts of collections.Counter
+    """
     words = collections.Counter()
     tokens = collections.Counter()
 
@@ -128,6 +613,109 @@ def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
         words.update(nl_tokens)
         tokens.update(code_tokens)
 
+    return VocabCounts(words, tokens)
+
+
+def count_vocab_range(filepath, start=0, stop=None):
+    """
+    Counts the tokens of the commits start to stop of a file of parsed
+    commits, only reading those commits, one at a time.
+
+    :param filepath: file written by preprocess.py
+    :param stop: if None, up to the last commit
+    :return: VocabCounts
+    """
+    with open(filepath, "rb") as f:
+        if start == 0 and stop is None:
+            return count_vocab(load_stream(f))
+        return count_vocab(load_stream_range(f, start, stop))
+
+
+def _count_vocab_range(args):
+    return count_vocab_range(*args)
+
+
+def count_vocab_files(filepaths, num_workers=1):
+    """
+    Counts the tokens of each file of parsed commits. With several workers
+    each file is split into num_workers ranges of commits, counted in
+    parallel and merged. Each worker only reads its own range, using the
+    offsets written by dump_stream. Files written without offsets are
+    counted whole.
+
+    :param filepaths: files written by preprocess.py
+    :param num_workers: number of processes
+    :return: list with the VocabCounts of each file
+    """
+    if num_workers <= 1:
+        return [count_vocab_range(filepath) for filepath in filepaths]
+
+    # (file number, range) of each shard
+    shards = []
+    for i, filepath in enumerate(filepaths):
+        with open(filepath, "rb") as f:
+            offsets = load_stream_offsets(f)
+        if offsets is None:
+            shards.append((i, (filepath, 0, None)))
+            continue
+        bounds = [len(offsets) * k // num_workers for k in range(num_workers + 1)]
+        shards += [(i, (filepath, start, stop)) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+    pool = Pool(num_workers)
+    try:
+        shard_counts = pool.map(_count_vocab_range, [shard for _, shard in shards])
+    finally:
+        pool.close()
+        pool.join()
+    return [merge_vocab_counts([counts for (j, _), counts in zip(shards, shard_counts) if j == i])
+            for i in range(len(filepaths))]
+
+
+def merge_vocab_counts(shard_counts):
+    """
+    :param shard_counts: iterable of VocabCounts
+    :return: VocabCounts with the summed counts
+    """
+    words = collections.Counter()
+    tokens = collections.Counter()
+    for counts in shard_counts:
+        words.update(counts.nl)
+        tokens.update(counts.code)
+    return VocabCounts(words, tokens)
+
+
+def save_vocab_counts(counts, f):
+    """
+    :param counts: VocabCounts
+    :param f: file opened in write mode
+    """
+    json.dump({"nl": counts.nl, "code": counts.code}, f)
+
+
+def load_vocab_counts(f):
+    """
+    :param f: file written by save_vocab_counts
+    :return: VocabCounts
+    """
+    data = json.load(f)
+    return VocabCounts(collections.Counter(data["nl"]), collections.Counter(data["code"]))
+
+
+def build_vocab_from_counts(counts, code_unk_threshold, nl_unk_threshold):
+    """
+    Generates the vocabularies and index_to_token mappings for both code an nl.
+    Ids are given by decreasing frequency and then token, so they only depend
+    on the counts and not on how they were sharded or merged.
+
+    :param counts: VocabCounts
+    :param code_unk_threshold: minimum freq. to consider a code token as UNKNOWN
+    :param nl_unk_threshold: minimum freq. to consider a nl token as UNKNOWN
+    :return: vocab
+    """
+
+    words = counts.nl
+    tokens = counts.code
+
     if "NEW_FILE" in  tokens:
         vocab = {"nl_to_num": {"UNK": UNK, "CODE_START": START, "CODE_END": END},
                  "code_to_num": {"UNK": UNK, "CODE_START": START, "CODE_END": END, "NEW_FILE": NEW_FILE},
@@ -147,7 +735,7 @@ def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
         nl_count = END + 1
 
     # Do unigram tokens, skip NEW_FILE
-    for tok in tokens:
+    for tok in sorted(tokens, key=lambda tok: (-tokens[tok], tok)):
         if tok != "NEW_FILE":
             if tokens[tok] > code_unk_threshold:
                 vocab["code_to_num"][tok] = token_count
@@ -156,7 +744,7 @@ def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
             else:
                 vocab["code_to_num"][tok] = UNK
 
-    for word in words:
+    for word in sorted(words, key=lambda word: (-words[word], word)):
         if words[word] > nl_unk_threshold:
             vocab["nl_to_num"][word] = nl_count
             vocab["num_to_nl"][nl_count] = word
@@ -170,6 +758,112 @@ def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
     return vocab
 
 
+def build_vocab(parsed_commits, code_unk_threshold, nl_unk_threshold):
+    """
+    Generates the vocabularies and index_to_token mappings for both code an nl
+
+    :param parsed_commits: list of tuples (sha, parsed_nl, parsed_code)
+    :param code_unk_threshold: minimum freq. to consider a code token as UNKNOWN
+    :param nl_unk_threshold: minimum freq. to consider a nl token as UNKNOWN
+    :param language: (str) language
+    :return: vocab
+    """
+    return build_vocab_from_counts(count_vocab(parsed_commits), code_unk_threshold, nl_unk_threshold)
+
+
+def build_entry(parsed_commit, vocab):
+    """
+    Numericalizes a single parsed commit
+
+    :param parsed_commit: ParsedCommit
+    :param vocab: vocabulary as generated by build_vocab
+    :return: dataset entry
+    """
+    sha, code, nl_tokens, code_tokens = parsed_commit
+
+    datasetEntry = {"id": sha,
+                    "code": code,
+                    "code_sizes": len(code_tokens),
+                    "code_num": [],
+                    "nl_num": []}
+
+    for tok in code_tokens:
+        if tok not in vocab["code_to_num"]:
+            vocab["code_to_num"][tok] = UNK
+        datasetEntry["code_num"].append(vocab["code_to_num"][tok])
+
+    datasetEntry["nl_num"].append(vocab["nl_to_num"]["CODE_START"])
+    for word in nl_tokens:
+        if word not in vocab["nl_to_num"]:
+            vocab["nl_to_num"][word] = UNK
+        datasetEntry["nl_num"].append(vocab["nl_to_num"][word])
+
+    datasetEntry["nl_num"].append(vocab["nl_to_num"]["CODE_END"])
+    return datasetEntry
+
+
+def is_within_length(datasetEntry, max_code_length=None, max_nl_length=None):
+    if max_code_length and len(datasetEntry["code_num"]) >= max_code_length:
+        return False
+    if max_nl_length and len(datasetEntry["nl_num"]) >= max_nl_length:
+        return False
+    return True
+
+
+def iter_build_data(parsed_commits, vocab, max_code_length=None, max_nl_length=None):
+    """
+    Generator version of build_data, yields the dataset entries that are
+    within the length limits one at a time.
+    """
+    for parsed_commit in parsed_commits:
+        datasetEntry = build_entry(parsed_commit, vocab)
+        if is_within_length(datasetEntry, max_code_length, max_nl_length):
+            yield datasetEntry
+
+
+class DataBuilder(object):
+    """
+    Builds a dataset like build_data from parsed commits added one at a
+    time, so several datasets can be built in a single pass over them.
+    """
+
+    def __init__(self, vocab, ref=False, max_code_length=None, max_nl_length=None):
+        """
+
+        :param vocab: vocabulary as generated by build_vocab
+        :param ref: if True, also build the reference list
+        :param max_code_length:
+        :param max_nl_length:
+        """
+        self.vocab = vocab
+        self.max_code_length = max_code_length
+        self.max_nl_length = max_nl_length
+        self.dataset = []
+        self.skipped = 0
+        self.ref_cont = [] if ref else None
+
+    def add(self, parsed_commit):
+        sha, code, nl_tokens, code_tokens = parsed_commit
+        datasetEntry = build_entry(parsed_commit, self.vocab)
+        if is_within_length(datasetEntry, self.max_code_length, self.max_nl_length):
+            self.dataset.append(datasetEntry)
+            if self.ref_cont is not None:
+                self.ref_cont.append((sha, " ".join(nl_tokens)))
+        else:
+            self.skipped += 1
+
+    def build(self):
+        """
+        :return: dataset, or dataset and reference list if ref
+        """
+        print 'Total size = ' + str(len(self.dataset))
+        print 'Total skipped = ' + str(self.skipped)
+
+        if self.ref_cont is not None:
+            return self.dataset, self.ref_cont
+        return self.dataset
+
+
 def build_data(parsed_commits, vocab, ref=False, max_code_length=None, max_nl_length=None):
     """
     Build the training dataset
@@ -181,59 +875,119 @@ def build_data(parsed_commits, vocab, ref=False, max_code_length=None, max_nl_le
     :param max_nl_length:
     :return: dataset
     """
+    builder = DataBuilder(vocab, ref=ref, max_code_length=max_code_length, max_nl_length=max_nl_length)
+    for parsed_commit in parsed_commits:
+        builder.add(parsed_commit)
+    return builder.build()
 
-    dataset = []
-    skipped = 0
 
-    if ref:
-        ref_cont = []
+STREAM_HEADER = "commitgen-stream"
+STREAM_END = "commitgen-stream-end"
+_STREAM_END_BYTES = pickle.dumps(STREAM_END, pickle.HIGHEST_PROTOCOL)
+# the position of STREAM_END is stored in the last bytes of the file
+_STREAM_FOOTER = struct.Struct("<Q")
 
-    for sha, code, nl_tokens, code_tokens in parsed_commits:
-        nlToks = nl_tokens
-        codeToks = code_tokens
 
-        datasetEntry = {"id": sha,
-                        "code": code,
-                        "code_sizes": len(codeToks),
-                        "code_num": [],
-                        "nl_num": []}
+def dump_stream(items, f):
+    """
+    Pickles the items of an iterable one by one, so they can be written
+    and read back without holding all of them in memory. The offset of each
+    item is written after them, so ranges of items can be read on their
+    own with load_stream_range.
 
-        for tok in codeToks:
-            if tok not in vocab["code_to_num"]:
-                vocab["code_to_num"][tok] = UNK
-            datasetEntry["code_num"].append(vocab["code_to_num"][tok])
-
-        datasetEntry["nl_num"].append(vocab["nl_to_num"]["CODE_START"])
-        for word in nlToks:
-            if word not in vocab["nl_to_num"]:
-                vocab["nl_to_num"][word] = UNK
-            datasetEntry["nl_num"].append(vocab["nl_to_num"][word])
-
-        datasetEntry["nl_num"].append(vocab["nl_to_num"]["CODE_END"])
-
-        if max_code_length or max_nl_length:
-            code_ok, nl_ok = True, True
-            if max_code_length and len(datasetEntry["code_num"]) >= max_code_length:
-                code_ok = False
-            if max_nl_length and len(datasetEntry["nl_num"]) >= max_nl_length:
-                nl_ok = False
-            if code_ok and nl_ok:
-                dataset.append(datasetEntry)
-                if ref:
-                    ref_cont.append((sha, " ".join(nl_tokens)))
-            else:
-                skipped += 1
-        else:
-            dataset.append(datasetEntry)
-            if ref:
-                ref_cont.append((sha, " ".join(nl_tokens)))
+    :param items: iterable of picklable objects
+    :param f: file opened in binary write mode
+    :return: number of dumped items
+    """
+    pickle.dump(STREAM_HEADER, f, pickle.HIGHEST_PROTOCOL)
+    offsets = []
+    for item in items:
+        offsets.append(f.tell())
+        pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+    end = f.tell()
+    f.write(_STREAM_END_BYTES)
+    pickle.dump(offsets, f, pickle.HIGHEST_PROTOCOL)
+    f.write(_STREAM_FOOTER.pack(end))
+    return len(offsets)
 
-    print 'Total size = ' + str(len(dataset))
-    print 'Total skipped = ' + str(skipped)
 
-    if ref:
-        return dataset, ref_cont
-    return dataset
+def load_stream(f):
+    """
+    Generator over the items in a file written by dump_stream. Files
+    containing a single pickled list, or items without their offsets, are
+    also accepted.
+
+    :param f: file opened in binary read mode
+    """
+    first = pickle.load(f)
+    if first != STREAM_HEADER:
+        for item in first:
+            yield item
+        return
+    while True:
+        try:
+            item = pickle.load(f)
+        except EOFError:
+            return
+        if isinstance(item, str) and item == STREAM_END:
+            return
+        yield item
+
+
+def load_stream_offsets(f):
+    """
+    :param f: file opened in binary read mode
+    :return: list with the offset of each item of a file written by dump_stream,
+             or None if the file was written without them
+    """
+    f.seek(0, 2)
+    size = f.tell()
+    if size < len(_STREAM_END_BYTES) + _STREAM_FOOTER.size:
+        return None
+    f.seek(size - _STREAM_FOOTER.size)
+    end, = _STREAM_FOOTER.unpack(f.read(_STREAM_FOOTER.size))
+    if end > size - _STREAM_FOOTER.size - len(_STREAM_END_BYTES):
+        return None
+    f.seek(end)
+    if f.read(len(_STREAM_END_BYTES)) != _STREAM_END_BYTES:
+        return None
+    return pickle.load(f)
+
+
+def stream_length(f):
+    """
+    :param f: file opened in binary read mode
+    :return: number of items in a file accepted by load_stream
+    """
+    offsets = load_stream_offsets(f)
+    if offsets is not None:
+        return len(offsets)
+    f.seek(0)
+    return sum(1 for _ in load_stream(f))
+
+
+def load_stream_range(f, start, stop, offsets=None):
+    """
+    Generator over the items start to stop of a file written by dump_stream,
+    only reading those items.
+
+    :param f: file opened in binary read mode
+    :param offsets: offsets of the items as returned by load_stream_offsets,
+                    read from the file if not given
+    """
+    if offsets is None:
+        offsets = load_stream_offsets(f)
+    if offsets is None:
+        f.seek(0)
+        for item in itertools.islice(load_stream(f), start, stop):
+            yield item
+        return
+    stop = min(stop, len(offsets))
+    if start >= stop:
+        return
+    f.seek(offsets[start])
+    for _ in xrange(stop - start):
+        yield pickle.load(f)
 
 
 def split_list(dataset, ratio=0.8, generate_test=False):
@@ -2,6 +2,8 @@
 # -*-coding: utf8 -*-
 
 
+import re
+import collections
 from pygments.lexers import guess_lexer, ClassNotFound
 #from guess_language import guess_language
 #from langdetect import detect_langs
@@ -29,45 +31,266 @@ from pygments.lexers import guess_lexer, ClassNotFound
 #         return False
 #     return False
 
-def get_added_lines(parsed_diff_file, marker=None):
+LINE_TYPE_ADDED = '+'
+LINE_TYPE_REMOVED = '-'
+LINE_TYPE_CONTEXT = ' '
+
+ADDED_FILE = 'A'
+REMOVED_FILE = 'D'
+MODIFIED_FILE = 'M'
+
+
+class DiffLine(collections.namedtuple('DiffLine', ['line_type', 'value'])):
+    """
+    Compact counterpart of unidiff.Line, keeping only the line type and value
+    """
+    __slots__ = ()
+
+    @property
+    def is_added(self):
+        return self.line_type == LINE_TYPE_ADDED
+
+    @property
+    def is_removed(self):
+        return self.line_type == LINE_TYPE_REMOVED
+
+    @property
+    def is_context(self):
+        return self.line_type == LINE_TYPE_CONTEXT
+
+
+class SourceLine(unicode):
+    """
+    Code line that remembers the path of the file it was extracted from.
+    It compares, hashes and joins like the plain line value.
+    """
+
+    def __new__(cls, value, path):
+        line = super(SourceLine, cls).__new__(cls, value)
+        line.path = path
+        return line
+
+    def __reduce__(self):
+        return SourceLine, (unicode(self), self.path)
+
+
+def _line_values(diff_file, lines, with_paths):
+    if with_paths:
+        return [SourceLine(line.value, diff_file.path) for line in lines]
+    return [line.value for line in lines]
+
+
+class DiffFile(list):
+    """
+    Compact counterpart of unidiff.PatchedFile, a list of hunks where each
+    hunk is a list of DiffLine
+    """
+
+    def __init__(self, path, status, hunks=()):
+        super(DiffFile, self).__init__(hunks)
+        self.path = path
+        self.status = status
+
+    @property
+    def is_added_file(self):
+        return self.status == ADDED_FILE
+
+    @property
+    def is_removed_file(self):
+        return self.status == REMOVED_FILE
+
+    @property
+    def is_modified_file(self):
+        return self.status == MODIFIED_FILE
+
+
+class DiffSet(list):
+    """
+    Compact counterpart of unidiff.PatchSet, a list of DiffFile exposing the
+    same modified_files/added_files/removed_files interface
+    """
+
+    @property
+    def added_files(self):
+        return [f for f in self if f.is_added_file]
+
+    @property
+    def removed_files(self):
+        return [f for f in self if f.is_removed_file]
+
+    @property
+    def modified_files(self):
+        return [f for f in self if f.is_modified_file]
+
+    @classmethod
+    def from_patchset(cls, patchset):
+        diff_set = cls()
+        for patched_file in patchset:
+            if patched_file.is_added_file:
+                status = ADDED_FILE
+            elif patched_file.is_removed_file:
+                status = REMOVED_FILE
+            else:
+                status = MODIFIED_FILE
+            hunks = [[DiffLine(line.line_type, line.value) for line in hunk]
+                     for hunk in patched_file]
+            diff_set.append(DiffFile(patched_file.path, status, hunks))
+        return diff_set
+
+    def to_tuples(self):
+        """
+        Plain (path, status, hunks) representation, cheap to pickle
+        """
+        return [(diff_file.path, diff_file.status,
+                 [[tuple(line) for line in hunk] for hunk in diff_file])
+                for diff_file in self]
+
+    @classmethod
+    def from_tuples(cls, data):
+        return cls(DiffFile(file_path, status,
+                            [[DiffLine(*line) for line in hunk] for hunk in hunks])
+                   for file_path, status, hunks in data)
+
+
+RE_SOURCE_FILENAME = re.compile(r'^--- (?P<filename>[^\t\n]+)')
+RE_TARGET_FILENAME = re.compile(r'^\+\+\+ (?P<filename>[^\t\n]+)')
+RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))?\ @@")
+NO_NEWLINE_MARKER = '\\ No newline at end of file'
+HUNK_LINE_TYPES = frozenset('- \n+\\')
+
+
+def _file_path(source_file, target_file):
+    if source_file.startswith('a/') and (target_file.startswith('b/') or target_file == '/dev/null'):
+        return source_file[2:]
+    if target_file.startswith('b/') and source_file == '/dev/null':
+        return target_file[2:]
+    return source_file
+
+
+def parse_diff(diff_lines):
+    """
+    Lightweight unified diff scanner, a faster alternative to unidiff.PatchSet
+    that only keeps what the extractors need: the path and status of each file
+    and the type and value of each hunk line. It follows the same parsing
+    rules as unidiff, so both produce the same lines and raise on the same
+    malformed diffs.
+
+    :param diff_lines: diff lines without line breaks, as from str.splitlines()
+    :return: DiffSet
+    """
+    diff_set = DiffSet()
+    # for each file: (path, [(source_start, source_length, target_start, target_length)], hunks)
+    files = []
+    current_file = None
+    source_file = None
+    lines = iter(diff_lines)
+    for line in lines:
+        if line.startswith('--- '):
+            match = RE_SOURCE_FILENAME.match(line)
+            if match:
+                source_file = match.group('filename')
+                current_file = None
+                continue
+        elif line.startswith('+++ '):
+            match = RE_TARGET_FILENAME.match(line)
+            if match:
+                if current_file is not None:
+                    raise ValueError('Target without source: %s' % line)
+                current_file = (_file_path(source_file, match.group('filename')), [], [])
+                files.append(current_file)
+                continue
+        elif line.startswith('@@ '):
+            match = RE_HUNK_HEADER.match(line)
+            if match:
+                if current_file is None:
+                    raise ValueError('Unexpected hunk found: %s' % line)
+                source_start, source_length, target_start, target_length = match.groups()
+                source_start = int(source_start)
+                source_length = 1 if source_length is None else int(source_length)
+                target_start = int(target_start)
+                target_length = 1 if target_length is None else int(target_length)
+                source_left, target_left = source_length, target_length
+                hunk = []
+                for hunk_line in lines:
+                    if not hunk_line or hunk_line[0] not in HUNK_LINE_TYPES:
+                        raise ValueError('Hunk diff line expected: %s' % hunk_line)
+                    line_type = hunk_line[0]
+                    if line_type == LINE_TYPE_ADDED:
+                        target_left -= 1
+                    elif line_type == LINE_TYPE_REMOVED:
+                        source_left -= 1
+                    elif line_type == LINE_TYPE_CONTEXT or line_type == '\n':
+                        line_type = LINE_TYPE_CONTEXT
+                        source_left -= 1
+                        target_left -= 1
+                    hunk.append(DiffLine(line_type, hunk_line[1:]))
+                    if source_left == 0 and target_left == 0:
+                        break
+                current_file[1].append((source_start, source_length, target_start, target_length))
+                current_file[2].append(hunk)
+        elif line.startswith(NO_NEWLINE_MARKER):
+            if current_file is None or not current_file[2]:
+                raise ValueError('Unexpected marker: %s' % line)
+            current_file[2][-1].append(DiffLine('\\', NO_NEWLINE_MARKER[1:] + '\n'))
+
+    for file_path, headers, hunks in files:
+        status = MODIFIED_FILE
+        if len(headers) == 1:
+            source_start, source_length, target_start, target_length = headers[0]
+            if source_start == 0 and source_length == 0:
+                status = ADDED_FILE
+            elif target_start == 0 and target_length == 0:
+                status = REMOVED_FILE
+        diff_set.append(DiffFile(file_path, status, hunks))
+    return diff_set
+
+
+def get_added_lines(parsed_diff_file, marker=None, with_paths=False):
     added_lines = []
     for modfile in parsed_diff_file.modified_files:
         if marker:
             added_lines.append(marker)
         for hunk in modfile:
-            added_lines += [line.value for line in hunk if line.is_added]
+            added_lines += _line_values(modfile, [line for line in hunk if line.is_added], with_paths)
     for addfile in parsed_diff_file.added_files:
         if marker:
             added_lines.append(marker)
         for hunk in addfile:
-            added_lines += [line.value for line in hunk if line.is_added]
+            added_lines += _line_values(addfile, [line for line in hunk if line.is_added], with_paths)
     return added_lines
 
 
-def get_removed_lines(parsed_diff_file, marker=None):
+def get_removed_lines(parsed_diff_file, marker=None, with_paths=False):
     removed_lines = []
     for modfile in parsed_diff_file.modified_files:
         if marker:
             removed_lines.append(marker)
         for hunk in modfile:
-            removed_lines += [line.value for line in hunk if line.is_removed]
+            removed_lines += _line_values(modfile, [line for line in hunk if line.is_removed], with_paths)
     for remfile in parsed_diff_file.removed_files:
         if marker:
             removed_lines.append(marker)
         for hunk in remfile:
-            removed_lines += [line.value for line in hunk if line.is_removed]
+            removed_lines += _line_values(remfile, [line for line in hunk if line.is_removed], with_paths)
     return removed_lines
 
 
 class AddRemExtractor(object):
 
-    def __init__(self, marker=None, line_filter=None):
+    def __init__(self, marker=None, line_filter=None, with_paths=False):
+        """
+
+        :param marker: if given, ghost line added before the lines of each file
+        :param line_filter: if given, function selecting the lines to keep
+        :param with_paths: if True, lines are SourceLine carrying the path of their file
+        """
         self.marker=marker
         self.line_filter = line_filter
+        self.with_paths = with_paths
 
     def get_lines(self, parsed_diff_file):
-        lines = get_added_lines(parsed_diff_file, marker=self.marker) \
-                + get_removed_lines(parsed_diff_file, marker=self.marker)
+        lines = get_added_lines(parsed_diff_file, marker=self.marker, with_paths=self.with_paths) \
+                + get_removed_lines(parsed_diff_file, marker=self.marker, with_paths=self.with_paths)
         if self.line_filter:
             return filter(self.line_filter, lines)
         else:
@@ -76,9 +299,16 @@ class AddRemExtractor(object):
 
 class PerFileExtractor(object):
 
-    def __init__(self, marker=None, line_filter=None):
+    def __init__(self, marker=None, line_filter=None, with_paths=False):
+        """
+
+        :param marker: if given, ghost line added before the lines of each file
+        :param line_filter: if given, function selecting the lines to keep
+        :param with_paths: if True, lines are SourceLine carrying the path of their file
+        """
         self.marker = marker
         self.line_filter = line_filter
+        self.with_paths = with_paths
 
     def get_lines(self, parsed_diff_file):
         """
@@ -95,17 +325,17 @@ class PerFileExtractor(object):
             if self.marker:
                 modified_lines.append(self.marker)
             for hunk in modfile:
-                modified_lines += [line.value for line in hunk]
+                modified_lines += _line_values(modfile, hunk, self.with_paths)
         for addfile in parsed_diff_file.added_files:
             if self.marker:
                 modified_lines.append(self.marker)
             for hunk in addfile:
-                modified_lines += [line.value for line in hunk]
+                modified_lines += _line_values(addfile, hunk, self.with_paths)
         for remfile in parsed_diff_file.removed_files:
             if self.marker:
                 modified_lines.append(self.marker)
             for hunk in remfile:
-                modified_lines += [line.value for line in hunk]
+                modified_lines += _line_values(remfile, hunk, self.with_paths)
         if self.line_filter:
             return filter(self.line_filter, modified_lines)
         else:
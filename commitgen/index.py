@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import sqlite3
+from os import path
+
+INDEX_FILE = "index.sqlite"
+
+COLUMNS = [("sha", "TEXT PRIMARY KEY"),
+           ("added_lines", "INTEGER"),
+           ("removed_lines", "INTEGER"),
+           ("context_lines", "INTEGER"),
+           ("modified_files", "INTEGER"),
+           ("added_files", "INTEGER"),
+           ("removed_files", "INTEGER"),
+           ("message_length", "INTEGER"),
+           ("date", "TEXT"),
+           ("author", "TEXT")]
+
+
+def default_index_path(data_path):
+    return path.join(data_path, INDEX_FILE)
+
+
+def _get(metadata, *keys):
+    try:
+        for key in keys:
+            metadata = metadata[key]
+        return metadata
+    except (KeyError, TypeError):
+        return None
+
+
+def build_index(raw_dataset, index_path, batch_size=1000, update=False):
+    """
+    Writes the stats and main metadata fields of every commit in a RawDataset
+    to a SQLite table named commits, so dataset slices can be selected with
+    select_shas without opening any diff. Use a lazy RawDataset to keep
+    memory bounded. Shas that cannot be loaded go to a table named unindexed,
+    so the index records every sha of the dataset it has seen.
+
+    :param raw_dataset: RawDataset
+    :param index_path: SQLite database file, overwritten if it exists
+    :param batch_size: number of rows inserted per statement
+    :param update: if True, keeps the existing index and only adds the shas it
+                   has not seen, e.g. after crawling new commits
+    :return: number of indexed commits
+    """
+    seen = indexed_shas(index_path) if update and path.isfile(index_path) else set()
+    connection = sqlite3.connect(index_path)
+    try:
+        if not update:
+            connection.execute("DROP TABLE IF EXISTS commits")
+            connection.execute("DROP TABLE IF EXISTS unindexed")
+        connection.execute("CREATE TABLE IF NOT EXISTS commits (" +
+                           ", ".join(name + " " + kind for name, kind in COLUMNS) + ")")
+        connection.execute("CREATE TABLE IF NOT EXISTS unindexed (sha TEXT PRIMARY KEY)")
+        insert = "INSERT INTO commits VALUES (" + ", ".join(["?"] * len(COLUMNS)) + ")"
+        indexed = 0
+        rows = []
+        for sha in raw_dataset.shas:
+            if sha in seen:
+                continue
+            try:
+                stats = raw_dataset.stats[sha]
+                metadata = raw_dataset.metadata[sha]
+            except KeyError:
+                connection.execute("INSERT INTO unindexed VALUES (?)", (sha,))
+                continue
+            rows.append((sha,) + tuple(stats) +
+                        (_get(metadata, 'commit', 'author', 'date'),
+                         _get(metadata, 'author', 'login')))
+            if len(rows) >= batch_size:
+                connection.executemany(insert, rows)
+                indexed += len(rows)
+                rows = []
+        connection.executemany(insert, rows)
+        indexed += len(rows)
+        connection.commit()
+    finally:
+        connection.close()
+    return indexed
+
+
+def indexed_shas(index_path):
+    """
+    :param index_path: SQLite database file written by build_index
+    :return: set of the shas build_index has seen, indexed or not
+    """
+    connection = sqlite3.connect(index_path)
+    try:
+        shas = set(str(row[0]) for row in connection.execute("SELECT sha FROM commits"))
+        if connection.execute("SELECT name FROM sqlite_master "
+                              "WHERE type = 'table' AND name = 'unindexed'").fetchone():
+            shas.update(str(row[0]) for row in connection.execute("SELECT sha FROM unindexed"))
+        return shas
+    finally:
+        connection.close()
+
+
+def check_index(index_path, shas):
+    """
+    Fails if some shas are missing from the index, as a query would silently
+    drop them
+
+    :param index_path: SQLite database file written by build_index
+    :param shas: shas of the dataset
+    """
+    if not path.isfile(index_path):
+        raise IOError("Index file " + index_path + " does not exist, run index_commits.py first")
+    missing = set(shas) - indexed_shas(index_path)
+    if missing:
+        raise ValueError(str(len(missing)) + " commits are missing from the index " + index_path +
+                         ", run index_commits.py --update first")
+
+
+def select_shas(index_path, query, params=()):
+    """
+    :param index_path: SQLite database file written by build_index
+    :param query: SQL condition on the commits table columns, e.g.
+                  "modified_files + added_files + removed_files = 1 AND date >= '2016'"
+    :param params: values for the ? placeholders in query
+    :return: set of shas matching the query
+    """
+    if not path.isfile(index_path):
+        raise IOError("Index file " + index_path + " does not exist, run index_commits.py first")
+    connection = sqlite3.connect(index_path)
+    try:
+        cursor = connection.execute("SELECT sha FROM commits WHERE " + query, params)
+        return set(str(row[0]) for row in cursor)
+    finally:
+        connection.close()
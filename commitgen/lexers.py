@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import re
+from pygments.token import Text, Comment, Operator, Keyword, Name, String, \
+    Number, Punctuation, Error
+
+
+def words(word_list, prefix='', suffix=''):
+    """
+    Alternation of literal words, longest first so it behaves like the
+    optimized pygments words() regex
+    """
+    return prefix + '(?:' + '|'.join([re.escape(word) for word in
+                                      sorted(word_list, key=len, reverse=True)]) + ')' + suffix
+
+
+# token type of a rule group whose text is lexed again from the root state,
+# like using(this) in pygments
+USING_THIS = object()
+
+
+class NativeLexer(object):
+    """
+    Small regex lexer covering only what commitgen keeps from the code:
+    identifiers, keywords, operators, punctuation and numbers. Comments,
+    strings and whitespace are still recognized (so they can be skipped)
+    but each one comes out as a single token.
+
+    The rules of every state are the ones of the corresponding pygments
+    lexer, in the same order, and are compiled into one master regex per
+    state so a token costs a single regex match. A rule is
+    (pattern, token type or tuple of types for each group[, new state]),
+    where a group typed USING_THIS is lexed by the lexer itself.
+    """
+
+    name = None
+    flags = re.MULTILINE
+    tokens = {}
+
+    _compiled = None
+
+    def __init__(self):
+        cls = self.__class__
+        if cls.__dict__.get('_compiled') is None:
+            cls._compiled = dict([(state, self._compile_state(rules))
+                                  for state, rules in cls.tokens.items()])
+
+    def _compile_state(self, rules):
+        patterns = []
+        actions = {}
+        group = 1
+        for rule in rules:
+            pattern, action = rule[0], rule[1]
+            new_state = rule[2] if len(rule) > 2 else None
+            if isinstance(new_state, str):
+                new_state = (new_state,)
+            patterns.append('(' + pattern + ')')
+            actions[group] = (action, new_state, group)
+            group += re.compile(pattern, self.flags).groups + 1
+        return re.compile('|'.join(patterns), self.flags), actions
+
+    def get_tokens(self, text):
+        """
+        Yields (token type, value) pairs for text, preprocessed the same way
+        pygments does it (decoding, newlines and final newline)
+        """
+        if not isinstance(text, unicode):
+            try:
+                text = text.decode('utf-8')
+            except UnicodeDecodeError:
+                text = text.decode('latin1')
+        if text.startswith(u'\ufeff'):
+            text = text[len(u'\ufeff'):]
+        text = text.replace('\r\n', '\n').replace('\r', '\n').strip('\n')
+        if not text.endswith('\n'):
+            text += '\n'
+        return self.get_tokens_unprocessed(text)
+
+    def get_tokens_unprocessed(self, text):
+        compiled = self._compiled
+        stack = ['root']
+        regex, actions = compiled['root']
+        scan = regex.scanner(text).match
+        pos = 0
+        end = len(text)
+        while pos < end:
+            m = scan()
+            if m is None:
+                # same recovery as pygments: newlines reset the state
+                if text[pos] == '\n':
+                    stack = ['root']
+                    regex, actions = compiled['root']
+                    yield Text, u'\n'
+                else:
+                    yield Error, text[pos]
+                pos += 1
+                scan = regex.scanner(text, pos).match
+                continue
+            action, new_state, group = actions[m.lastindex]
+            if action is not None:
+                if type(action) is tuple:
+                    for i, ttype in enumerate(action):
+                        value = m.group(group + i + 1)
+                        if not value:
+                            continue
+                        if ttype is USING_THIS:
+                            for token in self.get_tokens_unprocessed(value):
+                                yield token
+                        else:
+                            yield ttype, value
+                else:
+                    value = m.group()
+                    if value:
+                        yield action, value
+            pos = m.end()
+            if new_state is not None:
+                for state in new_state:
+                    if state == '#pop':
+                        if len(stack) > 1:
+                            stack.pop()
+                    elif state == '#push':
+                        stack.append(stack[-1])
+                    else:
+                        stack.append(state)
+                regex, actions = compiled[stack[-1]]
+                scan = regex.scanner(text, pos).match
+
+
+PYTHON_NAME = r'[^\W\d]\w*'
+
+
+class PythonNativeLexer(NativeLexer):
+
+    name = 'python'
+
+    tokens = {
+        'root': [
+            (r'\n', Text),
+            (r'^(\s*)([rRuUbB]{0,2})("""(?:.|\n)*?""")', (Text, String.Affix, String.Doc)),
+            (r"^(\s*)([rRuUbB]{0,2})('''(?:.|\n)*?''')", (Text, String.Affix, String.Doc)),
+            (r'[^\S\n]+', Text),
+            (r'\A#!.+$', Comment.Hashbang),
+            (r'#.*$', Comment.Single),
+            (r'[]{}:(),;[]', Punctuation),
+            (r'\\\n', Text),
+            (r'\\', Text),
+            (r'(?:in|is|and|or|not)\b', Operator.Word),
+            (r'!=|==|<<|>>|[-~+/*%=<>&^|.]', Operator),
+            (words(('assert', 'async', 'await', 'break', 'continue', 'del', 'elif',
+                    'else', 'except', 'finally', 'for', 'global', 'if', 'lambda',
+                    'pass', 'raise', 'nonlocal', 'return', 'try', 'while', 'yield',
+                    'yield from', 'as', 'with'), suffix=r'\b'), Keyword),
+            (words(('True', 'False', 'None'), suffix=r'\b'), Keyword.Constant),
+            (r'(def)((?:\s|\\\s)+)', (Keyword, Text), 'funcname'),
+            (r'(class)((?:\s|\\\s)+)', (Keyword, Text), 'classname'),
+            (r'(from)((?:\s|\\\s)+)', (Keyword.Namespace, Text), 'fromimport'),
+            (r'(import)((?:\s|\\\s)+)', (Keyword.Namespace, Text), 'import'),
+            (words(('__import__', 'abs', 'all', 'any', 'bin', 'bool', 'bytearray',
+                    'bytes', 'chr', 'classmethod', 'cmp', 'compile', 'complex',
+                    'delattr', 'dict', 'dir', 'divmod', 'enumerate', 'eval', 'filter',
+                    'float', 'format', 'frozenset', 'getattr', 'globals', 'hasattr',
+                    'hash', 'hex', 'id', 'input', 'int', 'isinstance', 'issubclass',
+                    'iter', 'len', 'list', 'locals', 'map', 'max', 'memoryview',
+                    'min', 'next', 'object', 'oct', 'open', 'ord', 'pow', 'print',
+                    'property', 'range', 'repr', 'reversed', 'round', 'set', 'setattr',
+                    'slice', 'sorted', 'staticmethod', 'str', 'sum', 'super', 'tuple',
+                    'type', 'vars', 'zip'), prefix=r'(?<!\.)', suffix=r'\b'),
+             Name.Builtin),
+            (r'(?<!\.)(?:self|Ellipsis|NotImplemented|cls)\b', Name.Builtin.Pseudo),
+            (r'(?<!\.)[A-Z]\w*(?:Error|Exception|Warning|Exit|Interrupt|Iteration)\b',
+             Name.Exception),
+            (r'__\w+__\b', Name.Function.Magic),
+            # strings come out whole, with their prefix
+            (r'(?:[rR][bBfF]?|[bBfF][rR])"""(?:[^"]|"(?!""))*(?:"""|\Z)', String.Double),
+            (r"(?:[rR][bBfF]?|[bBfF][rR])'''(?:[^']|'(?!''))*(?:'''|\Z)", String.Single),
+            (r'(?:[rR][bBfF]?|[bBfF][rR])"(?:[^"\\\n]|\\[\s\S]?)*"?', String.Double),
+            (r"(?:[rR][bBfF]?|[bBfF][rR])'(?:[^'\\\n]|\\[\s\S]?)*'?", String.Single),
+            (r'[uUbBfF]?"""(?:[^"\\]|\\[\s\S]?|"(?!""))*(?:"""|\Z)', String.Double),
+            (r"[uUbBfF]?'''(?:[^'\\]|\\[\s\S]?|'(?!''))*(?:'''|\Z)", String.Single),
+            (r'[uUbBfF]?"(?:[^"\\\n]|\\[\s\S]?)*"?', String.Double),
+            (r"[uUbBfF]?'(?:[^'\\\n]|\\[\s\S]?)*'?", String.Single),
+            (r'@' + PYTHON_NAME, Name.Decorator),
+            (r'@', Operator),
+            (PYTHON_NAME, Name),
+            (r'(?:\d(?:_?\d)*\.(?:\d(?:_?\d)*)?|(?:\d(?:_?\d)*)?\.\d(?:_?\d)*)'
+             r'(?:[eE][+-]?\d(?:_?\d)*)?', Number.Float),
+            (r'\d(?:_?\d)*[eE][+-]?\d(?:_?\d)*j?', Number.Float),
+            (r'0[oO](?:_?[0-7])+', Number.Oct),
+            (r'0[bB](?:_?[01])+', Number.Bin),
+            (r'0[xX](?:_?[a-fA-F0-9])+', Number.Hex),
+            (r'\d(?:_?\d)*', Number.Integer),
+        ],
+        'funcname': [
+            (r'__\w+__\b', Name.Function.Magic),
+            (PYTHON_NAME, Name.Function, '#pop'),
+            (r'', None, '#pop'),
+        ],
+        'classname': [
+            (PYTHON_NAME, Name.Class, '#pop'),
+        ],
+        'import': [
+            (r'(\s+)(as)(\s+)', (Text, Keyword, Text)),
+            (r'\.', Name.Namespace),
+            (PYTHON_NAME, Name.Namespace),
+            (r'(\s*)(,)(\s*)', (Text, Operator, Text)),
+            (r'', None, '#pop'),
+        ],
+        'fromimport': [
+            (r'(\s+)(import)\b', (Text, Keyword.Namespace), '#pop'),
+            (r'\.', Name.Namespace),
+            (r'None\b', Name.Builtin.Pseudo, '#pop'),
+            (PYTHON_NAME, Name.Namespace),
+            (r'', None, '#pop'),
+        ],
+    }
+
+
+JS_IDENT = r'(?:[^\W\d]|\$|\\u[a-fA-F0-9]{4})(?:[\w$]|\\u[a-fA-F0-9]{4})*'
+
+_JS_COMMENTS_AND_WHITESPACE = [
+    (r'\s+', Text),
+    (r'<!--', Comment),
+    (r'//.*?\n', Comment.Single),
+    (r'/\*.*?\*/', Comment.Multiline),
+]
+
+_JS_ROOT = [
+    (r'\A#! ?/.*?\n', Comment.Hashbang),
+    (r'^(?=\s|/|<!--)', Text, 'slashstartsregex'),
+] + _JS_COMMENTS_AND_WHITESPACE + [
+    (r'(?:\.\d+|[0-9]+\.[0-9]*)(?:[eE][-+]?[0-9]+)?', Number.Float),
+    (r'0[bB][01]+', Number.Bin),
+    (r'0[oO][0-7]+', Number.Oct),
+    (r'0[xX][0-9a-fA-F]+', Number.Hex),
+    (r'[0-9]+', Number.Integer),
+    (r'\.\.\.|=>', Punctuation),
+    (r'\+\+|--|~|&&|\?|:|\|\||\\(?=\n)|'
+     r'(?:<<|>>>?|==?|!=?|[-<>+*%&|^/])=?', Operator, 'slashstartsregex'),
+    (r'[{(\[;,]', Punctuation, 'slashstartsregex'),
+    (r'[})\].]', Punctuation),
+    (r'(?:for|in|while|do|break|return|continue|switch|case|default|if|else|'
+     r'throw|try|catch|finally|new|delete|typeof|instanceof|void|yield|'
+     r'this|of)\b', Keyword, 'slashstartsregex'),
+    (r'(?:var|let|with|function)\b', Keyword.Declaration, 'slashstartsregex'),
+    (r'(?:abstract|boolean|byte|char|class|const|debugger|double|enum|export|'
+     r'extends|final|float|goto|implements|import|int|interface|long|native|'
+     r'package|private|protected|public|short|static|super|synchronized|throws|'
+     r'transient|volatile)\b', Keyword.Reserved),
+    (r'(?:true|false|null|NaN|Infinity|undefined)\b', Keyword.Constant),
+    (r'(?:Array|Boolean|Date|Error|Function|Math|netscape|'
+     r'Number|Object|Packages|RegExp|String|Promise|Proxy|sun|decodeURI|'
+     r'decodeURIComponent|encodeURI|encodeURIComponent|'
+     r'Error|eval|isFinite|isNaN|isSafeInteger|parseFloat|parseInt|'
+     r'document|this|window)\b', Name.Builtin),
+    (JS_IDENT, Name.Other),
+    (r'"(?:\\\\|\\"|[^"])*"', String.Double),
+    (r"'(?:\\\\|\\'|[^'])*'", String.Single),
+    (r'`', String.Backtick, 'interp'),
+]
+
+
+class JavascriptNativeLexer(NativeLexer):
+
+    name = 'javascript'
+    flags = re.DOTALL | re.UNICODE | re.MULTILINE
+
+    tokens = {
+        'root': _JS_ROOT,
+        'slashstartsregex': _JS_COMMENTS_AND_WHITESPACE + [
+            (r'/(?:\\.|[^[/\\\n]|\[(?:\\.|[^\]\\\n])*])+/'
+             r'(?:[gimuy]+\b|\B)', String.Regex, '#pop'),
+            (r'(?=/)', Text, ('#pop', 'badregex')),
+            (r'', None, '#pop'),
+        ],
+        'badregex': [
+            (r'\n', Text, '#pop'),
+        ],
+        # template literal text comes out as a single token between
+        # interpolations
+        'interp': [
+            (r'`', String.Backtick, '#pop'),
+            (r'(?:\\\\|\\`|\$(?!\{)|[^`\\$])+', String.Backtick),
+            (r'\$\{', String.Interpol, 'interp-inside'),
+        ],
+        'interp-inside': [
+            (r'\}', String.Interpol, '#pop'),
+        ] + _JS_ROOT,
+    }
+
+
+JAVA_NAME = r'(?:[^\W\d]|\$)[\w$]*'
+
+
+class JavaNativeLexer(NativeLexer):
+
+    name = 'java'
+    flags = re.MULTILINE | re.DOTALL | re.UNICODE
+
+    tokens = {
+        'root': [
+            (r'[^\S\n]+', Text),
+            (r'//.*?\n', Comment.Single),
+            (r'/\*.*?\*/', Comment.Multiline),
+            (r'(?:assert|break|case|catch|continue|default|do|else|finally|for|'
+             r'if|goto|instanceof|new|return|switch|this|throw|try|while)\b',
+             Keyword),
+            # method names
+            (r'((?:(?:[^\W\d]|\$)[\w.\[\]$<>]*\s+)+?)'
+             r'(' + JAVA_NAME + r')(\s*)(\()',
+             (USING_THIS, Name.Function, Text, Punctuation)),
+            (r'@[^\W\d][\w.]*', Name.Decorator),
+            (r'(?:abstract|const|enum|extends|final|implements|native|private|'
+             r'protected|public|static|strictfp|super|synchronized|throws|'
+             r'transient|volatile)\b', Keyword.Declaration),
+            (r'(?:boolean|byte|char|double|float|int|long|short|void)\b',
+             Keyword.Type),
+            (r'(package)(\s+)', (Keyword.Namespace, Text), 'import'),
+            (r'(?:true|false|null)\b', Keyword.Constant),
+            (r'(class|interface)(\s+)', (Keyword.Declaration, Text), 'class'),
+            (r'(var)(\s+)', (Keyword.Declaration, Text), 'var'),
+            # as in pygments, "import static" is a single token
+            (r'(import(?:\s+static)?)(\s+)', (Keyword.Namespace, Text), 'import'),
+            (r'"(?:\\\\|\\"|[^"])*"', String),
+            (r"'\\.'|'[^\\]'|'\\u[0-9a-fA-F]{4}'", String.Char),
+            (r'(\.)(' + JAVA_NAME + ')', (Punctuation, Name.Attribute)),
+            (r'^\s*' + JAVA_NAME + ':', Name.Label),
+            (JAVA_NAME, Name),
+            (r'(?:[0-9][0-9_]*\.(?:[0-9][0-9_]*)?|'
+             r'\.[0-9][0-9_]*)'
+             r'(?:[eE][+\-]?[0-9][0-9_]*)?[fFdD]?|'
+             r'[0-9][eE][+\-]?[0-9][0-9_]*[fFdD]?|'
+             r'[0-9](?:[eE][+\-]?[0-9][0-9_]*)?[fFdD]|'
+             r'0[xX](?:[0-9a-fA-F][0-9a-fA-F_]*\.?|'
+             r'(?:[0-9a-fA-F][0-9a-fA-F_]*)?\.[0-9a-fA-F][0-9a-fA-F_]*)'
+             r'[pP][+\-]?[0-9][0-9_]*[fFdD]?', Number.Float),
+            (r'0[xX][0-9a-fA-F][0-9a-fA-F_]*[lL]?', Number.Hex),
+            (r'0[bB][01][01_]*[lL]?', Number.Bin),
+            (r'0[0-7_]+[lL]?', Number.Oct),
+            (r'0|[1-9][0-9_]*[lL]?', Number.Integer),
+            (r'[~^*!%&\[\]<>|+=/?-]', Operator),
+            (r'[{}();:.,]', Punctuation),
+            (r'\n', Text),
+        ],
+        'class': [
+            (JAVA_NAME, Name.Class, '#pop'),
+        ],
+        'var': [
+            (JAVA_NAME, Name, '#pop'),
+        ],
+        'import': [
+            (r'[\w.]+\*?', Name.Namespace, '#pop'),
+        ],
+    }
+
+
+# optional comment or whitespace before a preprocessor directive
+_C_WS1 = r'\s*(?:/[*].*?[*]/\s*)?'
+
+_C_WHITESPACE = [
+    (r'^#if\s+0', Comment.Preproc, 'if0'),
+    (r'^#', Comment.Preproc, 'macro'),
+    (r'^(' + _C_WS1 + r')(#if\s+0)', (Text, Comment.Preproc), 'if0'),
+    (r'^(' + _C_WS1 + r')(#)', (Text, Comment.Preproc), 'macro'),
+    (r'\n', Text),
+    (r'\s+', Text),
+    (r'\\\n', Text),
+    (r'//(?:\n|[\w\W]*?[^\\]\n)', Comment.Single),
+    (r'/(?:\\\n)?[*][\w\W]*?[*](?:\\\n)?/', Comment.Multiline),
+    (r'/(?:\\\n)?[*][\w\W]*', Comment.Multiline),
+]
+
+# return type, name and arguments of a function
+_C_FUNCTION = r'((?:[\w*\s])+?(?:\s|[*]))([a-zA-Z_]\w*)(\s*\([^;]*?\))'
+
+_C_TYPES = (
+    'size_t', 'ssize_t', 'off_t', 'wchar_t', 'ptrdiff_t', 'sig_atomic_t', 'fpos_t',
+    'clock_t', 'time_t', 'va_list', 'jmp_buf', 'FILE', 'DIR', 'div_t', 'ldiv_t',
+    'mbstate_t', 'wctrans_t', 'wint_t', 'wctype_t',
+    '_Bool', '_Complex', 'int8_t', 'int16_t', 'int32_t', 'int64_t', 'uint8_t',
+    'uint16_t', 'uint32_t', 'uint64_t', 'int_least8_t', 'int_least16_t',
+    'int_least32_t', 'int_least64_t', 'uint_least8_t', 'uint_least16_t',
+    'uint_least32_t', 'uint_least64_t', 'int_fast8_t', 'int_fast16_t', 'int_fast32_t',
+    'int_fast64_t', 'uint_fast8_t', 'uint_fast16_t', 'uint_fast32_t', 'uint_fast64_t',
+    'intptr_t', 'uintptr_t', 'intmax_t', 'uintmax_t',
+    'clockid_t', 'cpu_set_t', 'cpumask_t', 'dev_t', 'gid_t', 'id_t', 'ino_t', 'key_t',
+    'mode_t', 'nfds_t', 'pid_t', 'rlim_t', 'sig_t', 'sighandler_t', 'siginfo_t',
+    'sigset_t', 'sigval_t', 'socklen_t', 'timer_t', 'uid_t')
+
+_CPP_STATEMENTS = [
+    (words(('catch', 'const_cast', 'delete', 'dynamic_cast', 'explicit',
+            'export', 'friend', 'mutable', 'namespace', 'new', 'operator',
+            'private', 'protected', 'public', 'reinterpret_cast',
+            'restrict', 'static_cast', 'template', 'this', 'throw', 'throws',
+            'try', 'typeid', 'typename', 'using', 'virtual',
+            'constexpr', 'nullptr', 'decltype', 'thread_local',
+            'alignas', 'alignof', 'static_assert', 'noexcept', 'override',
+            'final'), suffix=r'\b'), Keyword),
+    (r'char(?:16_t|32_t)\b', Keyword.Type),
+    (r'(class)(\s+)', (Keyword, Text), 'classname'),
+    # strings come out whole, with their prefix
+    (r'R"(?P<delimiter>[^\\()\s]{0,16})\((?:.|\n)*?\)(?P=delimiter)"', String),
+    (r'(?:u8|u|U|L)?"(?:[^\\"\n]|\\[\s\S]?)*"?', String),
+    (r"L?'(?:\\.|\\[0-7]{1,3}|\\x[a-fA-F0-9]{1,2}|[^\\\'\n])'", String.Char),
+    (r'(?:\d+\.\d*|\.\d+|\d+)[eE][+-]?\d+[LlUu]*', Number.Float),
+    (r'(?:\d+\.\d*|\.\d+|\d+[fF])[fF]?', Number.Float),
+    (r'0x[0-9a-fA-F]+[LlUu]*', Number.Hex),
+    (r'0[0-7]+[LlUu]*', Number.Oct),
+    (r'\d+[LlUu]*', Number.Integer),
+    (r'\*/', Error),
+    (r'[~!%^&*+=|?:<>/-]', Operator),
+    (r'[()\[\],.]', Punctuation),
+    (words(('asm', 'auto', 'break', 'case', 'const', 'continue',
+            'default', 'do', 'else', 'enum', 'extern', 'for', 'goto',
+            'if', 'register', 'restricted', 'return', 'sizeof',
+            'static', 'struct', 'switch', 'typedef', 'union',
+            'volatile', 'while'), suffix=r'\b'), Keyword),
+    (r'(?:bool|int|long|float|short|double|char|unsigned|signed|void)\b',
+     Keyword.Type),
+    (words(('inline', '_inline', '__inline', 'naked', 'restrict',
+            'thread', 'typename'), suffix=r'\b'), Keyword.Reserved),
+    (r'__m(?:128i|128d|128|64)\b', Keyword.Reserved),
+    (words(('asm', 'int8', 'based', 'except', 'int16', 'stdcall', 'cdecl',
+            'fastcall', 'int32', 'declspec', 'finally', 'int64', 'try',
+            'leave', 'wchar_t', 'w64', 'unaligned', 'raise', 'noop',
+            'identifier', 'forceinline', 'assume'),
+           prefix=r'__', suffix=r'\b'), Keyword.Reserved),
+    (r'(?:true|false|NULL)\b', Name.Builtin),
+    (r'([a-zA-Z_]\w*)(\s*)(:)(?!:)', (Name.Label, Text, Punctuation)),
+    (words(_C_TYPES, suffix=r'\b'), Keyword.Type),
+    (r'[a-zA-Z_]\w*', Name),
+]
+
+
+class CppNativeLexer(NativeLexer):
+
+    name = 'cpp'
+    flags = re.MULTILINE
+
+    tokens = {
+        'root': _C_WHITESPACE + [
+            # functions
+            (_C_FUNCTION + r'([^;{]*)(\{)',
+             (USING_THIS, Name.Function, USING_THIS, USING_THIS, Punctuation),
+             'function'),
+            # function declarations
+            (_C_FUNCTION + r'([^;]*)(;)',
+             (USING_THIS, Name.Function, USING_THIS, USING_THIS, Punctuation)),
+            (r'', None, 'statement'),
+        ],
+        'statement': _C_WHITESPACE + _CPP_STATEMENTS + [
+            (r'[{}]', Punctuation),
+            (r';', Punctuation, '#pop'),
+        ],
+        'function': _C_WHITESPACE + _CPP_STATEMENTS + [
+            (r';', Punctuation),
+            (r'\{', Punctuation, '#push'),
+            (r'\}', Punctuation, '#pop'),
+        ],
+        'classname': [
+            (r'[a-zA-Z_]\w*', Name.Class, '#pop'),
+            (r'\s*(?=>)', Text, '#pop'),
+        ],
+        'macro': [
+            (r'(include)(' + _C_WS1 + r')([^\n]+)',
+             (Comment.Preproc, Text, Comment.PreprocFile)),
+            (r'[^/\n]+', Comment.Preproc),
+            (r'/[*](?:.|\n)*?[*]/', Comment.Multiline),
+            (r'//.*?\n', Comment.Single, '#pop'),
+            (r'/', Comment.Preproc),
+            (r'(?<=\\)\n', Comment.Preproc),
+            (r'\n', Comment.Preproc, '#pop'),
+        ],
+        'if0': [
+            (r'^\s*#if.*?(?<!\\)\n', Comment.Preproc, '#push'),
+            (r'^\s*#el(?:se|if).*\n', Comment.Preproc, '#pop'),
+            (r'^\s*#endif.*?(?<!\\)\n', Comment.Preproc, '#pop'),
+            (r'.*?\n', Comment),
+        ],
+    }
+
+
+NATIVE_LEXERS = {
+    "python": PythonNativeLexer,
+    "javascript": JavascriptNativeLexer,
+    "java": JavaNativeLexer,
+    "cpp": CppNativeLexer,
+}
+
+
+def get_native_lexer(language):
+    """
+    :param language: python, javascript, java or cpp
+    """
+    if language not in NATIVE_LEXERS:
+        raise NotImplementedError
+    return NATIVE_LEXERS[language]()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import json
+
+MANIFEST_VERSION = 1
+
+
+class PreprocessManifest(object):
+    """
+    Sidecar file of a preprocessing pickle recording the options it was built
+    with, the shas already processed into it and the next free commit id, so
+    that later runs only need to process the shas added since.
+    """
+
+    def __init__(self, manifest_path, options, output_path):
+        """
+        Loads the manifest if it matches the options and the output file
+        still exists, otherwise starts an empty one (a full run)
+
+        :param manifest_path: json file the manifest is loaded from and saved to
+        :param options: json-serializable dict of the options that change the output
+        :param output_path: preprocessing pickle the manifest describes
+        """
+        self.manifest_path = manifest_path
+        self.options = options
+        self.stale = False
+        self.reset()
+        if not os.path.isfile(manifest_path):
+            return
+        with open(manifest_path) as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION \
+                or data.get("options") != json.loads(json.dumps(options)) \
+                or not os.path.isfile(output_path):
+            self.stale = True
+            return
+        self.shas = set(data["shas"])
+        self.next_id = data["next_id"]
+
+    def reset(self):
+        """
+        Forgets the processed shas, for runs that rewrite the output from scratch
+        """
+        self.shas = set()
+        self.next_id = 0
+
+    @property
+    def is_empty(self):
+        return not self.shas
+
+    def update(self, shas, num_ids):
+        """
+        :param shas: shas processed in this run, kept or filtered out
+        :param num_ids: number of commit ids used in this run
+        """
+        self.shas.update(shas)
+        self.next_id += num_ids
+
+    def save(self):
+        data = {"version": MANIFEST_VERSION,
+                "options": self.options,
+                "next_id": self.next_id,
+                "shas": sorted(self.shas)}
+        tmp_path = self.manifest_path + '.' + str(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.manifest_path)
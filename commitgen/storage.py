@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import gzip
+import collections
+from os import path
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+COMPRESSIONS = ["gz", "xz"]
+
+# commit payload fields used by the preprocessing pipeline
+DEFAULT_METADATA_FIELDS = ["sha", "commit.message", "commit.author.date", "author.login"]
+
+
+def open_file(filepath, mode="rb"):
+    """
+    Opens a plain, gzip (.gz) or xz (.xz) compressed file depending on its extension
+
+    :param filepath: file path
+    :param mode: file mode
+    :return: file object
+    """
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, mode)
+    if filepath.endswith(".xz"):
+        if lzma is None:
+            raise ImportError("Reading or writing .xz files requires the backports.lzma package")
+        return lzma.open(filepath, mode)
+    return open(filepath, mode)
+
+
+def compressed_name(filename, compression=None):
+    """
+    :param filename: uncompressed file name, e.g. <sha>.diff
+    :param compression: None, "gz" or "xz"
+    :return: file name with the compression extension
+    """
+    if compression is None:
+        return filename
+    if compression not in COMPRESSIONS:
+        raise NotImplementedError
+    return filename + "." + compression
+
+
+def split_name(filename):
+    """
+    Splits a crawled file name into its sha and its extension, ignoring
+    the compression extension, e.g. <sha>.diff.gz -> (<sha>, ".diff")
+    """
+    name, ext = path.splitext(filename)
+    if ext[1:] in COMPRESSIONS:
+        name, ext = path.splitext(name)
+    return name, ext
+
+
+def list_files(folder_files, ext):
+    """
+    :param folder_files: file names in a crawled json or diff folder
+    :param ext: ".json" or ".diff"
+    :return: dict from sha to the name of its (possibly compressed) file,
+             in the order of folder_files
+    """
+    files = collections.OrderedDict()
+    for filename in folder_files:
+        sha, file_ext = split_name(filename)
+        if file_ext == ext:
+            files[sha] = filename
+    return files
+
+
+def project_metadata(metadata, fields):
+    """
+    Keeps only the given fields of a GitHub commit payload. Fields are dotted
+    paths into the nested dictionaries, e.g. "commit.message". Fields missing
+    from the payload are skipped.
+
+    :param metadata: commit payload as loaded from the json file
+    :param fields: list of dotted field paths
+    :return: projected dictionary with the same nesting
+    """
+    projected = {}
+    for field in fields:
+        keys = field.split(".")
+        value = metadata
+        try:
+            for key in keys:
+                value = value[key]
+        except (KeyError, TypeError):
+            continue
+        target = projected
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return projected
+
+
+def parse_fields(value):
+    """
+    Parses a comma-separated list of metadata fields given in the command
+    line, where "default" stands for DEFAULT_METADATA_FIELDS
+    """
+    if not value:
+        return None
+    if value == "default":
+        return DEFAULT_METADATA_FIELDS
+    return value.split(",")
@@ -9,14 +9,20 @@ import argparse
 import getpass
 from os import path, makedirs, listdir
 from commitgen.github import GitHub, ApiError
-
-def dump_json(commit, json_path):
-    with open(path.join(json_path, commit.sha + ".json"), "w") as json_file:
+from commitgen.storage import open_file, compressed_name, split_name, project_metadata, \
+    parse_fields, COMPRESSIONS, DEFAULT_METADATA_FIELDS
+
+def dump_json(commit, json_path, compression=None, fields=None):
+    json_filename = compressed_name(commit.sha + ".json", compression)
+    if fields:
+        commit = project_metadata(commit, fields)
+    with open_file(path.join(json_path, json_filename), "wb") as json_file:
         json.dump(commit, json_file)
 
 
-def dump_diff(sha, diff_string, diff_path):
-    with open(path.join(diff_path, sha + ".diff"), "w") as diff_file:
+def dump_diff(sha, diff_string, diff_path, compression=None):
+    diff_filename = compressed_name(sha + ".diff", compression)
+    with open_file(path.join(diff_path, diff_filename), "wb") as diff_file:
         try:
             diff_file.write(diff_string.encode("utf-8"))
         except Exception as e:
@@ -33,13 +39,13 @@ def reset_time(gh):
     return gh.x_ratelimit_reset
 
 
-def get_commit_info(gh, account, project, json_path):
+def get_commit_info(gh, account, project, json_path, compression=None, fields=None):
     commits_url = gh.repos(account)(project).commits
     more = True
     per_page = 500
     page = 2
-    existing_json_files = [filename.replace('.json', '')
-                           for filename in listdir(json_path)]
+    existing_json_files = set(split_name(filename)[0]
+                              for filename in listdir(json_path))
     tries = 0
     while more:
         if remaining(gh) > 0:
@@ -48,7 +54,7 @@ def get_commit_info(gh, account, project, json_path):
                 if response:
                     for commit in response:
                         if commit.sha not in existing_json_files:
-                            dump_json(commit, json_path)
+                            dump_json(commit, json_path, compression=compression, fields=fields)
                 page += 1
                 print "Page " + str(page)
                 print "Remaining Quota:  " + str(remaining(gh))
@@ -69,20 +75,20 @@ def get_commit_info(gh, account, project, json_path):
                 tries += 1
 
 
-def get_diff_files(gh, account, project, json_path, diff_path):
+def get_diff_files(gh, account, project, json_path, diff_path, compression=None):
     commits_url = gh.repos(account)(project).commits
-    existing_diff_files = [filename.replace('.diff', '')
-                           for filename in listdir(diff_path)]
+    existing_diff_files = set(split_name(filename)[0]
+                              for filename in listdir(diff_path))
 
     json_files = listdir(json_path)
 
     for i, filename in enumerate(json_files):
-        sha = filename.replace(".json", "")
+        sha = split_name(filename)[0]
         if sha not in existing_diff_files:
             if remaining(gh):
                 try:
                     response, more = commits_url(sha).get()
-                    dump_diff(sha, response, diff_path)
+                    dump_diff(sha, response, diff_path, compression=compression)
                 except ApiError as e:
                     print e
                     print "Maybe diff file was too big?"
@@ -125,6 +131,16 @@ if __name__ == "__main__":
                         action='store_true',
                         help="To download diff files")
 
+    parser.add_argument("--compression", "-c",
+                        choices=COMPRESSIONS,
+                        default=None,
+                        help="Compress the downloaded files, choose from " + ', '.join(COMPRESSIONS))
+
+    parser.add_argument("--fields", "-f",
+                        default=None,
+                        help="Comma-separated commit metadata fields to store, or 'default' for "
+                             + ','.join(DEFAULT_METADATA_FIELDS) + ". Default stores the full payload")
+
     args = parser.parse_args()
 
 
@@ -149,7 +165,10 @@ if __name__ == "__main__":
         makedirs(json_path)
 
     if args.metadata:
-        get_commit_info(gh, args.account, args.project, json_path)
+        get_commit_info(gh, args.account, args.project, json_path,
+                        compression=args.compression,
+                        fields=parse_fields(args.fields))
 
     if args.diff:
-        get_diff_files(gh, args.account, args.project, json_path, diff_path)
+        get_diff_files(gh, args.account, args.project, json_path, diff_path,
+                       compression=args.compression)
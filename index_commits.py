@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import argparse
+
+from commitgen.data import RawDataset
+from commitgen.index import build_index, default_index_path
+
+desc = "Help for index_commits"
+
+try:
+    work_dir = os.environ['WORK_DIR']
+except Exception:
+    print "Please set env. variable WORK_DIR, for example use: env WORK_DIR=. python index_commits.py"
+
+parser = argparse.ArgumentParser(description=desc)
+
+parser.add_argument("commits_path",
+                    help="Name of the commits folder in " + work_dir)
+
+diff_parsers = ["unidiff", "fast"]
+parser.add_argument('--diff_parser', "-dp",
+                    default="fast",
+                    choices=diff_parsers,
+                    help="Diff parser. Default='fast'. Allowed values are " + ', '.join(diff_parsers),
+                    metavar='')
+
+parser.add_argument('--diff_cache', "-dc",
+                    default=None,
+                    help="Folder where parsed diffs are cached between runs")
+
+parser.add_argument('--update', "-u",
+                    action='store_true',
+                    help="Only index the commits crawled since the index was built")
+
+args = parser.parse_args()
+
+commits_path = os.path.join(work_dir, args.commits_path)
+if not os.path.isdir(commits_path):
+    print commits_path + " does not exist"
+    exit()
+
+raw_dataset = RawDataset(commits_path, lazy=True, cache_size=1,
+                         cache_path=args.diff_cache,
+                         parser=args.diff_parser,
+                         metadata_fields=["commit.message", "commit.author.date", "author.login"])
+
+index_path = default_index_path(commits_path)
+indexed = build_index(raw_dataset, index_path, update=args.update)
+print "Indexed " + str(indexed) + " commits in " + index_path
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import argparse
+from commitgen.archive import pack_commits
+
+desc = "Help for pack_commits"
+
+parser = argparse.ArgumentParser(description=desc)
+
+parser.add_argument("commits_path",
+                    help="Path of the commits folder (containing the json and diff folders)")
+
+parser.add_argument("--archive_path", "-ap",
+                    default=None,
+                    help="Folder where the packed archive is written. Default=commits_path")
+
+args = parser.parse_args()
+
+if not os.path.isdir(args.commits_path):
+    print args.commits_path + " does not exist"
+    exit()
+
+archive_path = args.archive_path or args.commits_path
+if not os.path.isdir(archive_path):
+    os.makedirs(archive_path)
+
+packed = pack_commits(args.commits_path, archive_path=archive_path)
+print "Packed " + str(packed) + " commits in " + archive_path
@@ -1,28 +1,56 @@
 #!/usr/bin/env python
 # -*-coding: utf8 -*-
 
-import pickle
 import numpy as np
 import argparse
 import os
+import json
+from itertools import chain
+from collections import Counter
 
-from commitgen.data import RawDataset, extract_commits, parse_commits
-from commitgen.diff import AddRemExtractor, PerFileExtractor, get_added_lines, get_removed_lines
-from commitgen.code import CodeChunkTokenizer, CodeLinesTokenizer
+from commitgen.data import RawDataset, extract_commits, parse_commits, \
+    iter_extract_commits, iter_parse_commits, dump_stream, load_stream
+from commitgen.diff import AddRemExtractor, PerFileExtractor
+from commitgen.code import CodeChunkTokenizer, CodeLinesTokenizer, AutoTokenizer
 from commitgen.nlp import TreebankTokenizer
+from commitgen.storage import parse_fields
+from commitgen.cache import TokenCache
+from commitgen.manifest import PreprocessManifest
 from pygments.token import Comment, String, Whitespace, Text
 
 
 def is_only_removed(c):
-    return len(get_added_lines(c.diff_file)) == 0
+    return c.stats.added_lines == 0
 
 def is_only_added(c):
-    return len(get_removed_lines(c.diff_file)) == 0
+    return c.stats.removed_lines == 0
+
+def count_lengths(parsed_commits, totals):
+    for parsed_commit in parsed_commits:
+        totals["commits"] += 1
+        totals["nl"] += len(parsed_commit.nl_tokens)
+        totals["code"] += len(parsed_commit.code_tokens)
+        yield parsed_commit
+
+def count_commits(commits, totals):
+    for commit in commits:
+        totals["extracted"] += 1
+        yield commit
+
+def save_quarantine(quarantine, quarantine_path):
+    with open(quarantine_path, "w") as f:
+        json.dump([quarantined._asdict() for quarantined in quarantine], f, indent=2)
+    if quarantine:
+        print "Skipped " + str(len(quarantine)) + " commits over the time budget, listed in " + quarantine_path
+
+def done_shas(seen_shas, quarantine):
+    # quarantined commits are left out of the manifest, so --incremental tries them again
+    return seen_shas - set(quarantined.sha for quarantined in quarantine)
 
 def is_atomic(c):
-    return len(c.diff_file.modified_files) + \
-           len(c.diff_file.added_files) +  \
-           len(c.diff_file.removed_files) == 1
+    return c.stats.modified_files + \
+           c.stats.added_files + \
+           c.stats.removed_files == 1
 
 
 
@@ -38,11 +66,13 @@ parser = argparse.ArgumentParser(description=desc)
 parser.add_argument("commits_path",
                     help="Name of the commits folder in " + work_dir)
 
-languages = ["python", "cpp", "javascript", "java"]
+languages = ["python", "cpp", "javascript", "java", "auto"]
 parser.add_argument('--language', "-l",
                     choices = languages,
                     default=None,
-                    help="Language, choose from " + ', '.join(languages),
+                    help="Language, choose from " + ', '.join(languages) +
+                         ". 'auto' lexes each file with the language of its extension and skips "
+                         "files in other languages",
                     metavar="")
 
 code_extractors = ["add_rem", "per_file"]
@@ -53,11 +83,12 @@ parser.add_argument('--code_extractor', "-c",
                     metavar='')
 
 
-lexers = ["lines", "chunks"]
+lexers = ["lines", "chunks", "native"]
 parser.add_argument('--lexer', "-lx",
                     default="lines",
                     choices = lexers,
-                    help="Code lexer to use to pre-process code. Default='lines'. Allowed values are " + ', '.join(lexers),
+                    help="Code lexer to use to pre-process code. Default='lines'. Allowed values are " + ', '.join(lexers) +
+                         ". 'native' lexes lines like 'lines' with the faster built-in regex lexers instead of pygments",
                     metavar='')
 
 
@@ -87,6 +118,82 @@ parser.add_argument('--no_len_filters', "-nf",
                     action='store_true',
                     help="Atomic changes")
 
+parser.add_argument('--lazy', "-lz",
+                    action='store_true',
+                    help="Load diff and metadata files on access instead of up front")
+
+parser.add_argument('--cache_size', "-cs",
+                    type=int,
+                    default=1000,
+                    help="Number of loaded commits kept in memory with --lazy. Default=1000")
+
+parser.add_argument('--diff_cache', "-dc",
+                    default=None,
+                    help="Folder where parsed diffs are cached between runs")
+
+parser.add_argument('--load_workers', "-lw",
+                    type=int,
+                    default=1,
+                    help="Number of processes used to parse the diff files. Default=1")
+
+diff_parsers = ["unidiff", "fast"]
+parser.add_argument('--diff_parser', "-dp",
+                    default="unidiff",
+                    choices=diff_parsers,
+                    help="Diff parser. Default='unidiff'. Allowed values are " + ', '.join(diff_parsers),
+                    metavar='')
+
+parser.add_argument('--metadata_fields', "-mf",
+                    default=None,
+                    help="Comma-separated commit metadata fields to keep in memory, e.g. "
+                         "commit.message,author.login, or 'default' for the fields used in "
+                         "preprocessing. Default keeps all")
+
+parser.add_argument('--token_cache_size', "-tcs",
+                    type=int,
+                    default=0,
+                    help="Number of tokenized code lines memoized in memory by the lines and native lexers. Default=0 (disabled)")
+
+parser.add_argument('--token_cache', "-tc",
+                    default=None,
+                    help="File where memoized code line tokens are persisted between runs (lines and native lexers only)")
+
+parser.add_argument('--parse_workers', "-pw",
+                    type=int,
+                    default=1,
+                    help="Number of processes used to tokenize the commits. Default=1")
+
+parser.add_argument('--query', "-q",
+                    default=None,
+                    help="SQL condition to select commits from the index built by index_commits.py "
+                         "before loading any diff, e.g. \"added_files + removed_files + modified_files = 1\" "
+                         "(implies --lazy)")
+
+parser.add_argument('--stream', "-s",
+                    action='store_true',
+                    help="Stream commits through extraction, parsing and dumping with bounded memory (implies --lazy)")
+
+parser.add_argument('--max_diff_bytes', "-mdb",
+                    type=int,
+                    default=None,
+                    help="Skip commits whose raw diff file is larger than this many bytes, before parsing it")
+
+parser.add_argument('--max_diff_lines', "-mdl",
+                    type=int,
+                    default=None,
+                    help="Skip commits whose raw diff file has more lines than this, before parsing it")
+
+parser.add_argument('--time_budget', "-tb",
+                    type=float,
+                    default=None,
+                    help="Seconds a commit may take to tokenize. Slower commits are skipped and listed "
+                         "with their timing in a .quarantine.json file next to the output")
+
+parser.add_argument('--incremental', "-i",
+                    action='store_true',
+                    help="Only process the shas that are not yet in the output pickle and append them to it. "
+                         "Runs fully when the output was built with other options")
+
 args = parser.parse_args()
 
 if args.language is None:
@@ -97,10 +204,22 @@ if args.only_added and args.only_removed:
     print "Choose only_added or only_removed"
     exit()
 
+token_cache = None
+if args.token_cache_size > 0 or args.token_cache:
+    token_cache = TokenCache(max_size=args.token_cache_size or 100000,
+                             cache_path=args.token_cache)
+
 if args.lexer == "chunks":
-    lexer = CodeChunkTokenizer(language=args.language)
+    lexer_class, lexer_args = CodeChunkTokenizer, {}
+elif args.lexer == "native":
+    lexer_class, lexer_args = CodeLinesTokenizer, dict(token_cache=token_cache, engine="native")
 else:
-    lexer = CodeLinesTokenizer(language=args.language)
+    lexer_class, lexer_args = CodeLinesTokenizer, dict(token_cache=token_cache)
+
+if args.language == "auto":
+    lexer = AutoTokenizer(lexer_class, **lexer_args)
+else:
+    lexer = lexer_class(language=args.language, **lexer_args)
 
 
 tokenizer = TreebankTokenizer()
@@ -120,14 +239,17 @@ if args.only_removed:
 
 
 if args.code_extractor == "add_rem":
-    code_extractor = AddRemExtractor(marker=marker)
+    code_extractor = AddRemExtractor(marker=marker, with_paths=args.language == "auto")
 if args.code_extractor == "per_file":
-    code_extractor = PerFileExtractor(marker=marker)
+    code_extractor = PerFileExtractor(marker=marker, with_paths=args.language == "auto")
 
 
 if args.no_len_filters:
     parse_filters = []
+    max_tokens = None
 else:
+    # commits longer than that are dropped, so lexing them stops there
+    max_tokens = args.code_max_length
     # filtered parsed commits by code len and nl len
     parse_filters = [lambda pc: 1 <= len(pc.code_tokens) <= args.code_max_length,
                      lambda pc: 1 <= len(pc.nl_tokens) <= args.nl_max_length]
@@ -140,21 +262,130 @@ if not os.path.isdir(commits_path):
     print commits_path + " does not exist"
     exit()
 
-raw_dataset = RawDataset(commits_path)
+project_name = args.commits_path.split("_")[0]
+pickle_file_name = project_name
+if args.atomic:
+    pickle_file_name += "_atomic"
+if args.only_added:
+    pickle_file_name += "_added"
+if args.only_removed:
+    pickle_file_name += "_removed"
+pickle_file_name += ".pickle"
+
+pickle_store_path = os.path.join(work_dir, "preprocessing")
+if not os.path.isdir(pickle_store_path):
+    os.mkdir(pickle_store_path )
+pickle_file_path = os.path.join(pickle_store_path, pickle_file_name)
+
+# options changing the preprocessed commits, an incremental run
+# only appends to an output built with the same ones
+manifest_options = {"language": args.language,
+                    "code_extractor": args.code_extractor,
+                    "lexer": args.lexer,
+                    "diff_parser": args.diff_parser,
+                    "metadata_fields": parse_fields(args.metadata_fields),
+                    "code_max_length": args.code_max_length,
+                    "nl_max_length": args.nl_max_length,
+                    "atomic": args.atomic,
+                    "only_added": args.only_added,
+                    "only_removed": args.only_removed,
+                    "no_len_filters": args.no_len_filters,
+                    "query": args.query,
+                    "max_diff_bytes": args.max_diff_bytes,
+                    "max_diff_lines": args.max_diff_lines,
+                    "time_budget": args.time_budget}
+manifest = PreprocessManifest(pickle_file_path + ".manifest.json", manifest_options, pickle_file_path)
+if not args.incremental:
+    manifest.reset()
+elif manifest.stale:
+    print "Options changed since the last run, preprocessing all commits"
+elif not manifest.is_empty:
+    print "Skipping " + str(len(manifest.shas)) + " already preprocessed commits"
+
+raw_dataset = RawDataset(commits_path,
+                         lazy=args.lazy or args.stream or bool(args.query),
+                         cache_size=args.cache_size,
+                         cache_path=args.diff_cache,
+                         num_workers=args.load_workers,
+                         parser=args.diff_parser,
+                         metadata_fields=parse_fields(args.metadata_fields),
+                         exclude_shas=manifest.shas,
+                         max_diff_bytes=args.max_diff_bytes,
+                         max_diff_lines=args.max_diff_lines)
+
+seen_shas = set()
+quarantine = []
+
+if args.stream:
+    totals = Counter()
+    commits = iter_extract_commits(raw_dataset, code_extractor, filters=extract_filters,
+                                   query=args.query, seen=seen_shas)
+    parsed_commits = iter_parse_commits(count_commits(commits, totals), tokenizer, lexer,
+                                        filters=parse_filters,
+                                        ignore_types=ignore_list,
+                                        marker=marker,
+                                        num_workers=args.parse_workers,
+                                        start=manifest.next_id,
+                                        max_tokens=max_tokens,
+                                        time_budget=args.time_budget,
+                                        quarantine=quarantine)
+    parsed_commits = count_lengths(parsed_commits, totals)
+    previous = None
+    if not manifest.is_empty:
+        previous = open(pickle_file_path, "rb")
+        parsed_commits = chain(load_stream(previous), parsed_commits)
+    # the previous output is read while the merged one is written
+    with open(pickle_file_path + ".tmp", "wb") as f:
+        dump_stream(parsed_commits, f)
+    if previous:
+        previous.close()
+    os.rename(pickle_file_path + ".tmp", pickle_file_path)
+    manifest.update(done_shas(seen_shas, quarantine), totals["extracted"])
+    manifest.save()
+    if token_cache:
+        token_cache.save()
+    if args.time_budget is not None:
+        save_quarantine(quarantine, pickle_file_path + ".quarantine.json")
+    if raw_dataset.skipped:
+        print "Skipped " + str(raw_dataset.skipped) + " commits over the diff size limits"
+    print "Parsed " + str(totals["commits"]) + " commits"
+    if totals["commits"]:
+        print "Average NL length = " + str(1.0 * totals["nl"] / totals["commits"])
+        print "average Source Code length = " + str(1.0 * totals["code"] / totals["commits"])
+    print "Dumped processed commits in " + pickle_file_path
+    exit()
 
-commits = extract_commits(raw_dataset, code_extractor, filters=extract_filters)
+commits = extract_commits(raw_dataset, code_extractor, filters=extract_filters,
+                          query=args.query, seen=seen_shas)
+if raw_dataset.skipped:
+    print "Skipped " + str(raw_dataset.skipped) + " commits over the diff size limits"
 print "Extracted " + str(len(commits)) + " commits"
 
 
 parsed_commits = parse_commits(commits, tokenizer, lexer,
                                filters=parse_filters,
                                ignore_types=ignore_list,
-                               marker=marker)
-
+                               marker=marker,
+                               num_workers=args.parse_workers,
+                               start=manifest.next_id,
+                               max_tokens=max_tokens,
+                               time_budget=args.time_budget,
+                               quarantine=quarantine)
+
+if args.time_budget is not None:
+    save_quarantine(quarantine, pickle_file_path + ".quarantine.json")
 print "Parsed " + str(len(parsed_commits)) + " commits"
 
+if token_cache:
+    token_cache.save()
+
+if not manifest.is_empty:
+    with open(pickle_file_path, "rb") as f:
+        previous_commits = list(load_stream(f))
+    print "Merged with " + str(len(previous_commits)) + " previously parsed commits"
+    parsed_commits = previous_commits + parsed_commits
+
 
-from collections import Counter
 words = Counter()
 code_tokens = Counter()
 for parsed_commit in parsed_commits:
@@ -164,20 +395,8 @@ for parsed_commit in parsed_commits:
 print "Average NL length = " + str(np.mean([len(pc.nl_tokens) for pc in parsed_commits]))
 print "average Source Code length = " + str(np.mean([len(pc.code_tokens) for pc in parsed_commits]))
 
-project_name = args.commits_path.split("_")[0]
-pickle_file_name = project_name
-if args.atomic:
-    pickle_file_name += "_atomic"
-if args.only_added:
-    pickle_file_name += "_added"
-if args.only_removed:
-    pickle_file_name += "_removed"
-pickle_file_name += ".pickle"
-
-pickle_store_path = os.path.join(work_dir, "preprocessing")
-if not os.path.isdir(pickle_store_path):
-    os.mkdir(pickle_store_path )
-
-with open(os.path.join(pickle_store_path, pickle_file_name), "wb") as f:
-    pickle.dump(parsed_commits, f)
-    print "Dumped processed commits in " + os.path.join(pickle_store_path, pickle_file_name)
+with open(pickle_file_path, "wb") as f:
+    dump_stream(parsed_commits, f)
+    print "Dumped processed commits in " + pickle_file_path
+manifest.update(done_shas(seen_shas, quarantine), len(commits))
+manifest.save()
@@ -5,21 +5,22 @@ import os
 import argparse
 from pygments.token import Comment, String, Whitespace, Text
 
-from commitgen.data import RawDataset, extract_commits, parse_commits
-from commitgen.diff import PerFileExtractor, get_added_lines, get_removed_lines
+from commitgen.data import RawDataset, extract_parse_views
+from commitgen.diff import PerFileExtractor
 from commitgen.code import CodeLinesTokenizer
 from commitgen.nlp import TreebankTokenizer
+from commitgen.storage import parse_fields
 
 def is_only_removed(c):
-    return len(get_added_lines(c.diff_file)) == 0
+    return c.stats.added_lines == 0
 
 def is_only_added(c):
-    return len(get_removed_lines(c.diff_file)) == 0
+    return c.stats.removed_lines == 0
 
 def is_atomic(c):
-    return len(c.diff_file.modified_files) + \
-           len(c.diff_file.added_files) +  \
-           len(c.diff_file.removed_files) == 1
+    return c.stats.modified_files + \
+           c.stats.added_files + \
+           c.stats.removed_files == 1
 
 def get_len_filter(max_code_len, max_nl_len):
     return lambda pc: 1 <= len(pc.code_tokens) <= max_code_len \
@@ -45,6 +46,37 @@ parser.add_argument('--only_removed', "-or",
                     action='store_true',
                     help="Only removed")
 
+parser.add_argument('--lazy', "-lz",
+                    action='store_true',
+                    help="Load diff and metadata files on access instead of up front")
+
+parser.add_argument('--cache_size', "-cs",
+                    type=int,
+                    default=1000,
+                    help="Number of loaded commits kept in memory with --lazy")
+
+parser.add_argument('--diff_cache', "-dc",
+                    default=None,
+                    help="Folder where parsed diffs are cached between runs")
+
+parser.add_argument('--load_workers', "-lw",
+                    type=int,
+                    default=1,
+                    help="Number of processes used to parse the diff files. Default=1")
+
+diff_parsers = ["unidiff", "fast"]
+parser.add_argument('--diff_parser', "-dp",
+                    default="unidiff",
+                    choices=diff_parsers,
+                    help="Diff parser. Default='unidiff'. Allowed values are " + ', '.join(diff_parsers),
+                    metavar='')
+
+parser.add_argument('--metadata_fields', "-mf",
+                    default=None,
+                    help="Comma-separated commit metadata fields to keep in memory, e.g. "
+                         "commit.message,author.login, or 'default' for the fields used in "
+                         "preprocessing. Default keeps all")
+
 args = parser.parse_args()
 
 if args.only_added and args.only_removed:
@@ -58,7 +90,11 @@ treebank_tokenizer = TreebankTokenizer()
 
 data_path = os.path.join(work_dir, args.dataset + "_commits")
 
-raw_dataset = RawDataset(data_path)
+raw_dataset = RawDataset(data_path, lazy=args.lazy, cache_size=args.cache_size,
+                         cache_path=args.diff_cache,
+                         num_workers=args.load_workers,
+                         parser=args.diff_parser,
+                         metadata_fields=parse_fields(args.metadata_fields))
 
 all_filters = []
 atomic_filters = [is_atomic]
@@ -72,21 +108,14 @@ elif args.only_removed:
     atomic_filters.append(is_only_removed)
 
 
-commits = extract_commits(raw_dataset, per_file_code_extractor,
-                          filters=all_filters)
-
-atomic_commits = extract_commits(raw_dataset, per_file_code_extractor,
-                                 filters=atomic_filters)
-
-parsed_commits = parse_commits(commits, treebank_tokenizer,
-                               code_lines_tokenizer,
-                               ignore_types=ignore_list,
-                               marker=marker)
+views = extract_parse_views(raw_dataset, per_file_code_extractor,
+                            treebank_tokenizer, code_lines_tokenizer,
+                            {"all": all_filters, "atomic": atomic_filters},
+                            ignore_types=ignore_list,
+                            marker=marker)
 
-parsed_atomic_commits = parse_commits(atomic_commits, treebank_tokenizer,
-                                      code_lines_tokenizer,
-                                      ignore_types=ignore_list,
-                                      marker=marker)
+parsed_commits = views["all"]
+parsed_atomic_commits = views["atomic"]
 
 print "Parsed Commits " + str(len(parsed_commits))
 print "Atomic Parsed Commits " + str(len(parsed_atomic_commits))
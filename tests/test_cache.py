@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import tempfile
+import unittest
+from pygments.token import Comment, String, Whitespace, Text, string_to_tokentype
+from commitgen.cache import TokenCache
+from commitgen.code import CodeLinesTokenizer
+from commitgen.data import parse_commits
+from commitgen.nlp import TreebankTokenizer
+
+# same as preprocess.py
+IGNORE_TYPES = [Comment, String, Whitespace, Text]
+
+COMMITS = [("%040x" % i, "Fix bug %d" % i, ["x = %d" % i, "y = x + %d" % (i % 4), "return y"])
+           for i in range(24)]
+
+
+class TokenCacheWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_path = tempfile.mktemp(suffix=".pickle")
+
+    def tearDown(self):
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def parsed_entries(self, num_workers):
+        token_cache = TokenCache(cache_path=self.cache_path)
+        code_tokenizer = CodeLinesTokenizer("python", token_cache=token_cache)
+        parsed_commits = parse_commits(COMMITS, TreebankTokenizer(), code_tokenizer,
+                                       ignore_types=IGNORE_TYPES, num_workers=num_workers)
+        token_cache.save()
+        return parsed_commits, dict(TokenCache(cache_path=self.cache_path).memory._data)
+
+    def test_parse_workers(self):
+        parsed_commits, entries = self.parsed_entries(1)
+        os.remove(self.cache_path)
+        self.assertEqual(len(entries), 1 + 24 + 4)
+        self.assertEqual(self.parsed_entries(3), (parsed_commits, entries))
+        # cached token types are the pygments singletons
+        for types, tokens in entries.values():
+            for ttype in types:
+                self.assertTrue(ttype is string_to_tokentype(str(ttype)))
+
+    def test_batch_tokenize(self):
+        token_cache = TokenCache()
+        tokenizer = CodeLinesTokenizer("python", token_cache=token_cache)
+        chunks = [code_lines for _, _, code_lines in COMMITS]
+        try:
+            tokens = tokenizer.batch_tokenize(chunks, ignore_types=IGNORE_TYPES, num_processes=2)
+        finally:
+            tokenizer.close()
+        self.assertEqual(tokens, [CodeLinesTokenizer("python").tokenize(chunk, ignore_types=IGNORE_TYPES)
+                                  for chunk in chunks])
+        self.assertEqual(len(token_cache.memory._data), 1 + 24 + 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import unittest
+from pygments.token import Token, STANDARD_TYPES, Comment, String, Whitespace, Text, Name, Keyword
+from commitgen.diff import parse_diff
+from commitgen.code import CodeLinesTokenizer, CodeChunkTokenizer, TypeFilter, in_any, get_type_filter
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "benchmarks", "samples")
+
+LANGUAGES = ["python", "javascript", "java", "cpp"]
+
+IGNORE_TYPES = [
+    # same as preprocess.py
+    [Comment, String, Whitespace, Text],
+    [],
+    [Token],
+    [Name.Function, Keyword.Type],
+    [String.Doc, Comment.Single, Text],
+]
+
+
+def sample_chunks(language):
+    with open(os.path.join(SAMPLES, language + ".diff")) as f:
+        diff_set = parse_diff(f.read().decode('utf-8').splitlines())
+    return [[line.value.encode('utf-8') for line in hunk if line.line_type != '\\']
+            for diff_file in diff_set for hunk in diff_file]
+
+
+def lexed_types():
+    """
+    :return: set of the token types produced by every lexer on the sample diffs
+    """
+    types = set()
+    for language in LANGUAGES:
+        tokenizers = [CodeLinesTokenizer(language, engine="pygments"),
+                      CodeLinesTokenizer(language, engine="native"),
+                      CodeChunkTokenizer(language)]
+        for chunk in sample_chunks(language):
+            for tokenizer in tokenizers:
+                result = tokenizer.tokenize(chunk, return_types=True)
+                if result:
+                    types.update(result[1])
+    return types
+
+
+class TypeFilterTest(unittest.TestCase):
+
+    def test_same_as_in_any(self):
+        types = lexed_types() | set(STANDARD_TYPES)
+        # subtypes of the lexed types, and of subtypes, which no lexer produces
+        types |= set([ttype.Sub for ttype in types]) | set([ttype.Sub.Sub for ttype in types])
+        for ignore_types in IGNORE_TYPES:
+            type_filter = get_type_filter(ignore_types)
+            # twice, so the memoized answers are checked too
+            for _ in range(2):
+                for ttype in sorted(types):
+                    self.assertEqual(type_filter[ttype], not in_any(ttype, ignore_types),
+                                     "%s with %s ignored" % (ttype, ignore_types))
+
+    def test_shared(self):
+        ignore_types = [Comment, String, Whitespace, Text]
+        self.assertTrue(get_type_filter(ignore_types) is get_type_filter(tuple(ignore_types)))
+        self.assertTrue(isinstance(get_type_filter(ignore_types), TypeFilter))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import cPickle as pickle
+from commitgen.code import CodeLinesTokenizer
+from commitgen.data import RawDataset, ParsedCommit, iter_commits, dump_stream, load_stream, \
+    load_stream_offsets, load_stream_range, stream_length, count_vocab, count_vocab_files, \
+    extract_commits, parse_commits, extract_parse_views
+from commitgen.diff import AddRemExtractor
+from commitgen.nlp import TreebankTokenizer
+
+DIFF = """diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,1 +1,%d @@
+-x = 1
+%s
+"""
+
+
+class DiffCacheSizeLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        self.cache_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.data_path, "json"))
+        os.mkdir(os.path.join(self.data_path, "diff"))
+        # commit i adds i lines
+        for i in range(1, 6):
+            sha = "%040x" % i
+            with open(os.path.join(self.data_path, "json", sha + ".json"), "w") as f:
+                json.dump({"sha": sha, "message": "commit %d" % i}, f)
+            with open(os.path.join(self.data_path, "diff", sha + ".diff"), "w") as f:
+                f.write(DIFF % (i, "\n".join(["+x = %d" % j for j in range(i)])))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path)
+        shutil.rmtree(self.cache_path)
+
+    def load(self, max_diff_lines):
+        raw_dataset = RawDataset(self.data_path, lazy=True, cache_path=self.cache_path,
+                                 max_diff_lines=max_diff_lines)
+        reads = []
+        read_diff = raw_dataset.read_diff
+        raw_dataset.read_diff = lambda sha: reads.append(sha) or read_diff(sha)
+        shas = [commit.sha for commit in iter_commits(raw_dataset)]
+        return shas, raw_dataset.skipped, len(reads)
+
+    def test_cache_hits_do_not_read_diffs(self):
+        shas, skipped, reads = self.load(max_diff_lines=8)
+        self.assertEqual((len(shas), skipped, reads), (3, 2, 5))
+        # the sizes are cached too, for kept and skipped diffs
+        self.assertEqual(self.load(max_diff_lines=8), (shas, 2, 0))
+        # only the diffs skipped before need to be read and parsed
+        self.assertEqual(self.load(max_diff_lines=None)[1:], (0, 2))
+        self.assertEqual(self.load(max_diff_lines=8), (shas, 2, 0))
+
+
+class ExtractParseViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.data_path, "json"))
+        os.mkdir(os.path.join(self.data_path, "diff"))
+        for i in range(1, 7):
+            sha = "%040x" % i
+            metadata = {"sha": sha, "commit": {"message": "Fix bug %d" % i}}
+            # only some commits have the field the "labeled" view filters on
+            if i % 2:
+                metadata["labels"] = {"bug": i % 3 == 0}
+            with open(os.path.join(self.data_path, "json", sha + ".json"), "w") as f:
+                json.dump(metadata, f)
+            with open(os.path.join(self.data_path, "diff", sha + ".diff"), "w") as f:
+                f.write(DIFF % (i, "\n".join(["+x = %d" % j for j in range(i)])))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path)
+
+    def test_views_disagree(self):
+        views = {"all": [lambda commit: True],
+                 "labeled": [lambda commit: commit.metadata["labels"]["bug"]]}
+        raw_dataset = RawDataset(self.data_path)
+        extractor = AddRemExtractor()
+        parsed_views = extract_parse_views(raw_dataset, extractor, TreebankTokenizer(),
+                                           CodeLinesTokenizer("python"), views)
+        for name, view_filters in views.items():
+            commits = extract_commits(raw_dataset, extractor, filters=view_filters)
+            self.assertEqual(parsed_views[name],
+                             parse_commits(commits, TreebankTokenizer(), CodeLinesTokenizer("python")))
+        self.assertEqual((len(parsed_views["all"]), len(parsed_views["labeled"])), (6, 1))
+
+
+class CountVocabFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filepath = tempfile.mktemp(suffix=".pickle")
+        self.parsed_commits = [ParsedCommit(i, "", ["fix", "bug", str(i % 3)], ["x", "=", str(i % 5)])
+                               for i in range(20)]
+        with open(self.filepath, "wb") as f:
+            dump_stream(self.parsed_commits, f)
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def test_shards_merge_to_whole_counts(self):
+        whole = count_vocab(self.parsed_commits)
+        for num_workers in [1, 3]:
+            self.assertEqual(count_vocab_files([self.filepath, self.filepath], num_workers=num_workers),
+                             [whole, whole])
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [ParsedCommit(i, "code %d" % i, ["nl"], ["x"] * i) for i in range(10)]
+        self.filepath = tempfile.mktemp(suffix=".pickle")
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def test_ranges(self):
+        with open(self.filepath, "wb") as f:
+            self.assertEqual(dump_stream(self.items, f), 10)
+        with open(self.filepath, "rb") as f:
+            self.assertEqual(list(load_stream(f)), self.items)
+            self.assertEqual(len(load_stream_offsets(f)), 10)
+            self.assertEqual(stream_length(f), 10)
+            for start in range(11):
+                for stop in range(start, 12):
+                    self.assertEqual(list(load_stream_range(f, start, stop)), self.items[start:stop])
+
+    def test_pickled_list(self):
+        with open(self.filepath, "wb") as f:
+            pickle.dump(self.items, f)
+        with open(self.filepath, "rb") as f:
+            self.assertEqual(load_stream_offsets(f), None)
+            self.assertEqual(stream_length(f), 10)
+            self.assertEqual(list(load_stream_range(f, 3, 7)), self.items[3:7])
+
+
+if __name__ == '__main__':
+    unittest.main()
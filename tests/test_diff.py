@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import unittest
+from unidiff import PatchSet
+from commitgen.diff import DiffSet, parse_diff
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "benchmarks", "samples")
+
+NO_NEWLINE = u"""diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,2 +1,2 @@
+ x = 1
+-y = 2
+\\ No newline at end of file
++y = 3
+\\ No newline at end of file
+"""
+
+ADDED_FILE = u"""diff --git a/new.py b/new.py
+new file mode 100644
+--- /dev/null
++++ b/new.py
+@@ -0,0 +1,2 @@
++import os
++print os.sep
+"""
+
+REMOVED_FILE = u"""diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-import os
+-print os.sep
+"""
+
+NO_LENGTHS = u"""--- a/one.py
++++ b/one.py
+@@ -3 +3 @@
+-a = 1
++a = 2
+--- a/two.py
++++ b/two.py
+@@ -0,0 +1 @@
++b = 1
+"""
+
+SEVERAL_HUNKS = u"""--- a/c.py
++++ b/c.py
+@@ -1,3 +1,3 @@
+ def f():
+-    return 1
++    return 2
+ 
+@@ -10,2 +10,3 @@ def g():
+     pass
++    pass
+ # end
+"""
+
+MALFORMED = [
+    # hunk line without a type
+    u"--- a/m.py\n+++ b/m.py\n@@ -1,2 +1,2 @@\n x\n?y\n",
+    # empty line inside a hunk, lines are expected without line breaks
+    u"--- a/m.py\n+++ b/m.py\n@@ -1,2 +1,2 @@\n x\n\n-y\n+z\n",
+    # hunk before any file header
+    u"@@ -1,1 +1,1 @@\n-x\n+y\n",
+    # target file header twice
+    u"--- a/m.py\n+++ b/m.py\n+++ b/m.py\n@@ -1,1 +1,1 @@\n-x\n+y\n",
+    # no newline marker outside a hunk
+    u"--- a/m.py\n+++ b/m.py\n\\ No newline at end of file\n",
+]
+
+
+class ParseDiffTest(unittest.TestCase):
+    """
+    parse_diff must give the same DiffSet as unidiff and raise on the same diffs
+    """
+
+    def assertSameDiffSet(self, diff):
+        lines = diff.splitlines()
+        expected = DiffSet.from_patchset(PatchSet(lines))
+        parsed = parse_diff(lines)
+        self.assertEqual(parsed.to_tuples(), expected.to_tuples())
+        for name in ("added_files", "removed_files", "modified_files"):
+            self.assertEqual([f.path for f in getattr(parsed, name)],
+                             [f.path for f in getattr(expected, name)])
+
+    def test_samples(self):
+        for name in sorted(os.listdir(SAMPLES)):
+            with open(os.path.join(SAMPLES, name)) as f:
+                self.assertSameDiffSet(f.read().decode('utf-8'))
+
+    def test_no_newline_marker(self):
+        self.assertSameDiffSet(NO_NEWLINE)
+
+    def test_dev_null(self):
+        self.assertSameDiffSet(ADDED_FILE)
+        self.assertSameDiffSet(REMOVED_FILE)
+        self.assertSameDiffSet(ADDED_FILE + REMOVED_FILE)
+        self.assertEqual(len(parse_diff(ADDED_FILE.splitlines()).added_files), 1)
+        self.assertEqual(len(parse_diff(REMOVED_FILE.splitlines()).removed_files), 1)
+
+    def test_hunk_header_without_lengths(self):
+        self.assertSameDiffSet(NO_LENGTHS)
+
+    def test_several_hunks(self):
+        self.assertSameDiffSet(SEVERAL_HUNKS)
+
+    def test_malformed(self):
+        for diff in MALFORMED:
+            lines = diff.splitlines()
+            self.assertRaises(Exception, PatchSet, lines)
+            self.assertRaises(ValueError, parse_diff, lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
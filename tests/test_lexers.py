@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import unittest
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Comment, String, Whitespace, Text, Name, Keyword
+from commitgen.diff import parse_diff
+from commitgen.lexers import get_native_lexer, NATIVE_LEXERS
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "benchmarks", "samples")
+
+# same as preprocess.py
+IGNORE_TYPES = [Comment, String, Whitespace, Text]
+
+
+def filtered(tokens):
+    """
+    (type, value) pairs kept by the tokenizers
+    """
+    return [(ttype, value) for ttype, value in tokens
+            if not any(ttype in ignore_type for ignore_type in IGNORE_TYPES)]
+
+
+def sample_texts(language):
+    """
+    Each line of the hunks of the language sample diff, and each hunk as a
+    whole, the way the tokenizers lex lines and chunks
+    """
+    with open(os.path.join(SAMPLES, language + ".diff")) as f:
+        diff_set = parse_diff(f.read().decode('utf-8').splitlines())
+    texts = []
+    for diff_file in diff_set:
+        for hunk in diff_file:
+            lines = [line.value for line in hunk if line.line_type != '\\']
+            texts += lines
+            texts.append(u'\n'.join(lines))
+    return texts
+
+
+class NativeLexerTest(unittest.TestCase):
+    """
+    The native lexers must give the filtered pygments token stream
+    """
+
+    def test_samples(self):
+        for language in sorted(NATIVE_LEXERS):
+            pygments_lexer = get_lexer_by_name(language)
+            native_lexer = get_native_lexer(language)
+            for text in sample_texts(language):
+                self.assertEqual(filtered(native_lexer.get_tokens(text)),
+                                 filtered(pygments_lexer.get_tokens(text)),
+                                 "%s: %r" % (language, text))
+
+    def test_multiline(self):
+        # the signature rules of pygments match across lines, so whether a
+        # word is a keyword or a function name depends on the previous lines
+        texts = {
+            "java": [u"int x\nif (y) {", u"String s\nif (y) {",
+                     u"Foo bar\nwhile (x)", u"foo if (x)",
+                     u"public void f(int a) {\n    g(a);\n}"],
+            "cpp": [u"int x\nif (y) {", u"else if (x) {",
+                    u"else if (a && b) return;", u"} else if (x) {",
+                    u"static int f(int a) {\n    if (a) {\n        g();\n    }\n    h();\n}\nint k;",
+                    u"int f(int a);\nreturn f(x);"],
+        }
+        for language in sorted(texts):
+            pygments_lexer = get_lexer_by_name(language)
+            native_lexer = get_native_lexer(language)
+            for text in texts[language]:
+                self.assertEqual(filtered(native_lexer.get_tokens(text)),
+                                 filtered(pygments_lexer.get_tokens(text)),
+                                 "%s: %r" % (language, text))
+        tokens = filtered(get_native_lexer("cpp").get_tokens(u"int x\nif (y) {"))
+        self.assertIn((Name.Function, u"if"), tokens)
+
+    def test_java_import_static(self):
+        # pygments lexes "import static" as a single Keyword.Namespace token,
+        # and so does the native lexer
+        text = u"import static java.lang.Math.max;"
+        expected = [(Keyword.Namespace, u"import static"), (Name.Namespace, u"java.lang.Math.max")]
+        self.assertEqual(filtered(get_lexer_by_name("java").get_tokens(text))[:2], expected)
+        self.assertEqual(filtered(get_native_lexer("java").get_tokens(text))[:2], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
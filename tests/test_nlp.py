@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+import os
+import re
+import random
+import unittest
+from commitgen.nlp import TreebankTokenizer
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "treebank_corpus.txt")
+
+# the rules of the Treebank sed script, applied one by one
+STARTING_QUOTES = [
+    (re.compile(r'^\"'), r'``'),
+    (re.compile(r'(``)'), r' \1 '),
+    (re.compile(r'([ (\[{<])"'), r'\1 `` '),
+]
+PUNCTUATION = [
+    (re.compile(r'([:,])([^\d])'), r' \1 \2'),
+    (re.compile(r'([:,])$'), r' \1 '),
+    (re.compile(r'\.\.\.'), r' ... '),
+    (re.compile(r'[;@#$%&]'), r' \g<0> '),
+    (re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r'\1 \2\3 '),
+    (re.compile(r'[?!]'), r' \g<0> '),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+]
+PARENS_BRACKETS = [
+    (re.compile(r'[\]\[\(\)\{\}\<\>]'), r' \g<0> '),
+    (re.compile(r'--'), r' -- '),
+]
+ENDING_QUOTES = [
+    (re.compile(r'"'), " '' "),
+    (re.compile(r'(\S)(\'\')'), r'\1 \2 '),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+]
+CONTRACTIONS = [re.compile(r"(?i)\b(can)(not)\b"),
+                re.compile(r"(?i)\b(d)('ye)\b"),
+                re.compile(r"(?i)\b(gim)(me)\b"),
+                re.compile(r"(?i)\b(gon)(na)\b"),
+                re.compile(r"(?i)\b(got)(ta)\b"),
+                re.compile(r"(?i)\b(lem)(me)\b"),
+                re.compile(r"(?i)\b(mor)('n)\b"),
+                re.compile(r"(?i)\b(wan)(na) "),
+                re.compile(r"(?i) ('t)(is)\b"),
+                re.compile(r"(?i) ('t)(was)\b")]
+
+# pieces the rules match on, so random texts exercise their interactions
+PIECES = ["'t", "'T", "is", "was", "can", "not", "d", "'ye", "gim", "me", "gon", "na", "got", "ta",
+          "lem", "mor", "'n", "wan", "'s", "n't", "'ll", ",", ":", "1", ".", "...", ";", "#", "?", "!",
+          "'", "''", '"', "`", "``", "(", ")", "[", "]", "<", ">", "{", "}", "-", "--", "a", " ", "\n"]
+
+
+def reference_tokenize(text):
+    for regexp, substitution in STARTING_QUOTES + PUNCTUATION + PARENS_BRACKETS:
+        text = regexp.sub(substitution, text)
+    text = " " + text + " "
+    for regexp, substitution in ENDING_QUOTES:
+        text = regexp.sub(substitution, text)
+    for regexp in CONTRACTIONS:
+        text = regexp.sub(r' \1 \2 ', text)
+    return text.split()
+
+
+class TreebankTokenizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tokenizer = TreebankTokenizer(memo_size=0)
+
+    def test_corpus(self):
+        with open(CORPUS, 'r') as f:
+            for line in f:
+                text = line.rstrip("\n")
+                self.assertEqual(self.tokenizer.tokenize(text), reference_tokenize(text), repr(text))
+
+    def test_random_texts(self):
+        rnd = random.Random(0)
+        for _ in xrange(20000):
+            text = "".join([rnd.choice(PIECES) for _ in xrange(rnd.randint(1, 10))])
+            self.assertEqual(self.tokenizer.tokenize(text), reference_tokenize(text), repr(text))
+
+    def test_sequential_contractions(self):
+        self.assertEqual(self.tokenizer.tokenize("'tis'twas"), ["'t", "is", "'t", "was"])
+
+    def test_batch_tokenize(self):
+        with open(CORPUS, 'r') as f:
+            texts = [line.rstrip("\n") for line in f]
+        self.assertEqual(TreebankTokenizer().batch_tokenize(texts + texts),
+                         [reference_tokenize(text) for text in texts + texts])
+
+
+if __name__ == '__main__':
+    unittest.main()